@@ -0,0 +1,193 @@
+"""
+Benchmark suite
+Times each stage of the solver on generated instances (see generator.py)
+with warmup runs and repeats, and saves the results as JSON so they can be compared across versions.
+
+stages:
+    - import: Importer without binary cache (parse, marginal and rank matrices)
+    - import_cached: Importer reading the binary cache
+    - dummy_greedy_net: initial greedy assignment
+    - calculate_savings: full savings list on the greedy net
+    - close_facility: simulated closure (and undo) of one open facility, mean over the open facilities
+    - savings_heur: complete savings heuristic
+
+usage:
+    python src/benchmark.py --sizes 50x200 100x1000 --repeats 5 --output out/bench.json
+    python src/benchmark.py --sizes 50x200 --compare out/bench.json
+"""
+
+from importer import Importer
+from network import Action
+from heuristic import dummy_greedy_net, calculate_savings, savings_heur
+import generator
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+
+STAGES = ["import", "import_cached", "dummy_greedy_net", "calculate_savings", "close_facility", "savings_heur"]
+
+
+def time_stage(function, warmup:int=1, repeats:int=3) -> list:
+    """
+    time a function (stdout suppressed) after the warmup runs
+    returns the list of run times in seconds
+    """
+    times = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for run in range(warmup + repeats):
+            start_time = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start_time
+            if run >= warmup:
+                times.append(elapsed)
+    return times
+
+
+def close_all_facilities(net):
+    """
+    simulate (and undo) the closure of every open facility
+    returns the number of simulated closures
+    """
+    open_facilities = net.get_open_facilities()
+    for facility in open_facilities:
+        Action(net).close_facility(facility, verbose=False).undo()
+    return len(open_facilities)
+
+
+def benchmark_instance(path:str, stages=STAGES, warmup:int=1, repeats:int=3) -> dict:
+    """
+    time the selected stages on one instance
+    returns {stage: list of run times}
+    """
+    timings = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # warm the binary cache and build the shared greedy net
+        data = Importer(path)
+        net = dummy_greedy_net(data)
+    if "import" in stages:
+        timings["import"] = time_stage(lambda: Importer(path, use_cache=False), warmup=warmup, repeats=repeats)
+    if "import_cached" in stages:
+        timings["import_cached"] = time_stage(lambda: Importer(path), warmup=warmup, repeats=repeats)
+    if "dummy_greedy_net" in stages:
+        timings["dummy_greedy_net"] = time_stage(lambda: dummy_greedy_net(data), warmup=warmup, repeats=repeats)
+    if "calculate_savings" in stages:
+        timings["calculate_savings"] = time_stage(lambda: calculate_savings(net, verbose=False), warmup=warmup, repeats=repeats)
+    if "close_facility" in stages:
+        number_open = len(net.get_open_facilities())
+        times = time_stage(lambda: close_all_facilities(net), warmup=warmup, repeats=repeats)
+        timings["close_facility"] = [elapsed / max(number_open, 1) for elapsed in times]
+    if "savings_heur" in stages:
+        timings["savings_heur"] = time_stage(lambda: savings_heur(path), warmup=warmup, repeats=repeats)
+    return timings
+
+
+def summarize(times:list) -> dict:
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "max": max(times),
+        "times": times,
+    }
+
+
+def git_revision() -> str:
+    """
+    current git commit of the repository ('' if not available)
+    """
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return output.stdout.strip()
+
+
+def run_benchmark(sizes=generator.SIZES, file_formats=tuple(generator.FORMATS), stages=STAGES,
+                  seed:int=1, warmup:int=1, repeats:int=3, folder:str=generator.OUTPUT_FOLDER) -> dict:
+    """
+    generate the instances (if needed) and benchmark them
+    returns the benchmark report (metadata and one result per instance and stage)
+    """
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "warmup": warmup,
+            "repeats": repeats,
+        },
+        "results": [],
+    }
+    for size, file_format, path in generator.generate(sizes, file_formats, seed, folder):
+        print(f"> benchmarking {size} ({file_format})")
+        for stage, times in benchmark_instance(path, stages, warmup, repeats).items():
+            result = {"size": size, "format": file_format, "stage": stage, **summarize(times)}
+            report["results"].append(result)
+            print(f"  {stage:<18} median {result['median']:.4f}s  min {result['min']:.4f}s")
+    return report
+
+
+def compare(report:dict, baseline:dict):
+    """
+    print the median time ratio (current / baseline) of the results found in both reports
+    """
+    baseline_results = {(result["size"], result["format"], result["stage"]): result for result in baseline["results"]}
+    print(f"comparison with revision '{baseline['meta'].get('revision', '')}' ({baseline['meta'].get('date', '')})")
+    for result in report["results"]:
+        key = (result["size"], result["format"], result["stage"])
+        if key not in baseline_results:
+            continue
+        baseline_median = baseline_results[key]["median"]
+        ratio = result["median"] / baseline_median if baseline_median else float("inf")
+        print(f"  {result['size']:<11} {result['format']:<11} {result['stage']:<18} "
+              f"{baseline_median:.4f}s -> {result['median']:.4f}s  (x{ratio:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solver stages on generated instances")
+    parser.add_argument("--sizes", nargs="+", default=generator.SIZES, help="facilities x clients, e.g. 50x200")
+    parser.add_argument("--formats", nargs="+", default=list(generator.FORMATS), choices=list(generator.FORMATS))
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--folder", default=generator.OUTPUT_FOLDER, help="folder of the generated instances")
+    parser.add_argument("--output", default=None, help="results file (default: out/benchmark_<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="previous results file to compare with")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.sizes, args.formats, args.stages, args.seed, args.warmup, args.repeats, args.folder)
+    output = args.output
+    if output is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = f"out/benchmark_{timestamp}.json"
+    folder = os.path.dirname(output)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results saved: {output}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
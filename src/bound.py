@@ -0,0 +1,156 @@
+"""
+Lagrangian lower bound
+The assignment constraints (each client assigned once) are relaxed with one multiplier per client:
+    L(u) = Sum(u) + min Sum_j (cost_open_j + v_j(u)) y_j   s.t.  Sum_j capacity_j y_j >= total demand
+where v_j(u) is the value of a (fractional) knapsack of facility j over the reduced costs cost_ij - u_i,
+and the multipliers are improved by subgradient optimisation.
+Every L(u) is a lower bound of the optimal cost, so gap = (cost - lower bound) / cost
+bounds the distance of any solution from the optimum.
+
+usage:
+    bound = LagrangianBound(data)
+    bound.solve(upper_bound=net.total_cost)
+    bound.gap(net.total_cost)
+"""
+
+from importer import Importer, BLOCK_SIZE
+from instrument import logger, stats
+import time
+import numpy as np
+
+BOUND_ITERATIONS = 300
+# subgradient step: initial factor, halved after PATIENCE iterations without improvement
+STEP_FACTOR = 2.0
+MIN_STEP_FACTOR = 1e-4
+PATIENCE = 20
+
+
+class LagrangianBound:
+    """
+    Class for calculating a lower bound of an instance by Lagrangian relaxation
+    The multipliers are kept between calls to solve, so the bound can be improved
+    later (e.g. with a better upper bound)
+    """
+    def __init__(self, data:Importer):
+        self.data = data
+        number_clients, number_facilities = data.costs.shape
+        self.total_demand = float(data.demand.sum())
+        # initial multipliers: cheapest assignment cost of each client
+        self.multipliers = np.empty(number_clients)
+        rows = max(1, BLOCK_SIZE // max(number_facilities, 1))
+        for start in range(0, number_clients, rows):
+            self.multipliers[start:start + rows] = np.asarray(data.costs[start:start + rows]).min(axis=1)
+        self.lower_bound = -np.inf
+        self.iterations = 0
+
+    def knapsacks(self, multipliers):
+        """
+        fractional knapsack of every facility over the negative reduced costs (vectorised)
+        returns the knapsack values (by facility) and the selected items:
+        client, facility and selected fraction of each item
+        """
+        data = self.data
+        number_clients, number_facilities = data.costs.shape
+        items_cli = []
+        items_fac = []
+        items_reduced = []
+        rows = max(1, BLOCK_SIZE // max(number_facilities, 1))
+        for start in range(0, number_clients, rows):
+            reduced = np.asarray(data.costs[start:start + rows], dtype=np.float64) - multipliers[start:start + rows, np.newaxis]
+            cli_idx, fac_idx = np.nonzero(reduced < 0)
+            items_cli.append(cli_idx + start)
+            items_fac.append(fac_idx)
+            items_reduced.append(reduced[cli_idx, fac_idx])
+        cli_idx = np.concatenate(items_cli)
+        fac_idx = np.concatenate(items_fac)
+        reduced = np.concatenate(items_reduced)
+        demand = data.demand[cli_idx]
+        # items of each facility by increasing reduced cost per unit of demand
+        with np.errstate(divide="ignore"):
+            ratio = np.where(demand > 0, reduced / np.where(demand > 0, demand, 1.0), -np.inf)
+        order = np.lexsort((ratio, fac_idx))
+        cli_idx, fac_idx, reduced, demand = cli_idx[order], fac_idx[order], reduced[order], demand[order]
+        # demand of the previous items of the same facility
+        before = np.cumsum(demand) - demand
+        first = np.searchsorted(fac_idx, fac_idx)
+        before -= before[first]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(demand > 0, (data.capacity[fac_idx] - before) / np.where(demand > 0, demand, 1.0), 1.0)
+        fraction = np.clip(fraction, 0.0, 1.0)
+        values = np.bincount(fac_idx, weights=fraction * reduced, minlength=number_facilities)
+        return values, cli_idx, fac_idx, fraction
+
+    def evaluate(self, multipliers):
+        """
+        Lagrangian function value and subgradient for the given multipliers
+        """
+        data = self.data
+        number_clients = len(multipliers)
+        values, cli_idx, fac_idx, fraction = self.knapsacks(multipliers)
+        fac_values = data.cost_open + values
+        # open the facilities with negative value, then cover the total demand (fractional)
+        opened = (fac_values < 0).astype(float)
+        missing = self.total_demand - float(data.capacity @ opened)
+        if missing > 0:
+            closed = np.flatnonzero(opened == 0)
+            closed = closed[np.argsort(fac_values[closed] / data.capacity[closed], kind="stable")]
+            covered = np.cumsum(data.capacity[closed]) - data.capacity[closed]
+            opened[closed] = np.clip((missing - covered) / data.capacity[closed], 0.0, 1.0)
+        value = float(multipliers.sum() + fac_values @ opened)
+        assigned = np.bincount(cli_idx, weights=fraction * opened[fac_idx], minlength=number_clients)
+        return value, 1.0 - assigned
+
+    def solve(self, upper_bound=None, iterations:int=BOUND_ITERATIONS, gap_target=None, deadline=None) -> float:
+        """
+        subgradient optimisation of the multipliers
+        upper_bound: cost of a known solution (steps are proportional to upper_bound - L(u)),
+        without it the cost of opening all facilities with every client at its most expensive one is used
+        stops after 'iterations', when the step becomes too small, when the gap to upper_bound
+        falls below gap_target or at deadline (time.perf_counter value)
+        returns the best lower bound found
+        """
+        data = self.data
+        if upper_bound is None:
+            upper_bound = float(data.cost_open.sum()) + sum(
+                float(np.asarray(data.costs[cli_idx]).max()) for cli_idx in range(len(data.demand)))
+        multipliers = self.multipliers.copy()
+        step_factor = STEP_FACTOR
+        without_improvement = 0
+        with stats.timer("lower_bound"):
+            for _ in range(iterations):
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                value, subgradient = self.evaluate(multipliers)
+                self.iterations += 1
+                if value > self.lower_bound:
+                    self.lower_bound = value
+                    self.multipliers = multipliers.copy()
+                    without_improvement = 0
+                else:
+                    without_improvement += 1
+                    if without_improvement >= PATIENCE:
+                        step_factor /= 2
+                        without_improvement = 0
+                        if step_factor < MIN_STEP_FACTOR:
+                            break
+                if gap_target is not None and self.gap(upper_bound) <= gap_target:
+                    break
+                norm = float(subgradient @ subgradient)
+                if norm == 0:
+                    # the relaxed solution is feasible: the bound is optimal
+                    break
+                step = step_factor * max(upper_bound - value, 0.0) / norm
+                if step == 0:
+                    break
+                multipliers += step * subgradient
+        stats.count("bound_iterations", self.iterations)
+        logger.info("> lower bound: %f (%d subgradient iterations)", self.lower_bound, self.iterations)
+        return self.lower_bound
+
+    def gap(self, cost:float) -> float:
+        """
+        relative gap of a solution cost: (cost - lower bound) / cost
+        """
+        if cost <= 0:
+            return 0.0
+        return max(cost - self.lower_bound, 0.0) / cost
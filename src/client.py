@@ -5,13 +5,19 @@
 class Client:
     """
     Class for handling clients
+    Lightweight view of a client of an instance:
+    'index' is the position of the client in the instance arrays (Importer.demand)
     """
-    def __init__(self, id, demand):
+    __slots__ = ("id", "index", "demand", "is_active")
+
+    def __init__(self, id, demand, index=None, verbose=False):
         self.id = id
+        self.index = id - 1 if index is None else index
         self.demand = demand
         self.is_active = True
 
-        self.message_on_create()
+        if verbose:
+            self.message_on_create()
 
     def __str__(self) -> str:
         return f"Client {self.id}"
@@ -20,4 +26,4 @@ class Client:
         return f"Client {self.id}"
 
     def message_on_create(self):
-        print(f"Client {self.id} - demand: {self.demand}")
\ No newline at end of file
+        print(f"Client {self.id} - demand: {self.demand}")
@@ -6,15 +6,19 @@
 class Facility():
     """
     Class for handling facilities
+    Lightweight view of a facility of an instance:
+    'index' is the position of the facility in the instance arrays (Importer.capacity, Importer.cost_open)
     """
-    def __init__(self, id: str, capacity: float, cost_open: float):
+    __slots__ = ("id", "index", "capacity", "cost_open")
+
+    def __init__(self, id: int, capacity: float, cost_open: float, index: int = None, verbose=False):
         self.id = id
+        self.index = id - 1 if index is None else index
         self.capacity = capacity
         self.cost_open = cost_open
-        # self.is_open = True
-        # self.served_clients = []
 
-        self.message_on_creation()
+        if verbose:
+            self.message_on_creation()
     
     def __str__(self) -> str:
         return f"Facility {self.id}"
@@ -25,6 +29,5 @@ class Facility():
     def message_on_creation(self):
         """
         Message on creation
-        TODO: add verbose option to disable message
         """
-        print(f"Facility {self.id} - capacity: {self.capacity}; cost: {self.cost_open}")
\ No newline at end of file
+        print(f"Facility {self.id} - capacity: {self.capacity}; cost: {self.cost_open}")
@@ -0,0 +1,119 @@
+"""
+Synthetic instance generator
+Writes reproducible (fixed seed) instances in the Holmberg and OR-Library file formats:
+    - Holmberg: costs block with one row per client
+    - OR-Library: costs block with one row per facility
+Facilities and clients are random points in the unit square, assignment costs are
+proportional to the distance, capacities cover the total demand CAPACITY_RATIO times.
+
+usage:
+    python src/generator.py --sizes 50x200 1000x10000 --seed 1
+"""
+
+import argparse
+import os
+import numpy as np
+
+FORMATS = {
+    "Holmberg": "Holmberg_Instances",
+    "OR-Library": "OR-Library_Instances",
+}
+SIZES = ["50x200", "100x1000", "200x2000", "500x5000", "1000x10000"]
+OUTPUT_FOLDER = "inputs/Generated"
+CAPACITY_RATIO = 3.0
+DEMAND_RANGE = (5, 35)
+OPEN_COST_RANGE = (300.0, 900.0)
+COST_SCALE = 100.0
+
+
+def parse_size(size:str) -> tuple:
+    """
+    '50x200' -> (50 facilities, 200 clients)
+    """
+    number_facilities, number_clients = [int(number) for number in size.lower().split("x")]
+    return number_facilities, number_clients
+
+
+def generate_instance(number_facilities:int, number_clients:int, seed:int=1) -> dict:
+    """
+    generate instance arrays: capacity, cost_open, demand and costs (clients x facilities)
+    """
+    rng = np.random.default_rng(seed)
+    fac_points = rng.random((number_facilities, 2))
+    cli_points = rng.random((number_clients, 2))
+    demand = rng.integers(DEMAND_RANGE[0], DEMAND_RANGE[1] + 1, number_clients).astype(float)
+    # random capacities around the average capacity needed to cover the demand CAPACITY_RATIO times
+    mean_capacity = CAPACITY_RATIO * demand.sum() / number_facilities
+    capacity = np.round(mean_capacity * rng.uniform(0.5, 1.5, number_facilities))
+    capacity = np.maximum(capacity, demand.max())
+    cost_open = np.round(rng.uniform(*OPEN_COST_RANGE, number_facilities))
+    distance = np.sqrt(((cli_points[:, np.newaxis, :] - fac_points[np.newaxis, :, :]) ** 2).sum(axis=2))
+    costs = np.round(COST_SCALE * distance)
+    return {"capacity": capacity, "cost_open": cost_open, "demand": demand, "costs": costs}
+
+
+def write_instance(path:str, instance:dict, file_format:str="Holmberg"):
+    """
+    write instance arrays in the given file format
+    """
+    capacity = instance["capacity"]
+    number_clients, number_facilities = instance["costs"].shape
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w") as file:
+        # block 1: number of facilities and clients
+        file.write(f"{number_facilities} {number_clients}\n")
+        # block 2: facilities capacities and open costs
+        np.savetxt(file, np.column_stack([capacity, instance["cost_open"]]), fmt="%.10g")
+        # block 3: client demands (10 per line)
+        demand = instance["demand"]
+        for start in range(0, number_clients, 10):
+            file.write(" ".join(f"{value:.10g}" for value in demand[start:start + 10]) + "\n")
+        # block 4: client-facility costs
+        if file_format == "Holmberg":
+            np.savetxt(file, instance["costs"], fmt="%.10g")
+        else:
+            np.savetxt(file, instance["costs"].T, fmt="%.10g")
+
+
+def instance_path(size:str, file_format:str, seed:int, folder:str=OUTPUT_FOLDER) -> str:
+    """
+    path of a generated instance, inside a folder named after its instance type (see Importer)
+    """
+    return os.path.join(folder, FORMATS[file_format], f"gen_{size}_s{seed}")
+
+
+def generate(sizes=SIZES, file_formats=tuple(FORMATS), seed:int=1, folder:str=OUTPUT_FOLDER, overwrite=False) -> list:
+    """
+    generate and write the instances of the given sizes and formats
+    existing files are kept unless overwrite is set
+    returns the list of (size, format, path)
+    """
+    generated = []
+    for size in sizes:
+        instance = None
+        for file_format in file_formats:
+            path = instance_path(size, file_format, seed, folder)
+            if overwrite or not os.path.isfile(path):
+                if instance is None:
+                    instance = generate_instance(*parse_size(size), seed=seed)
+                write_instance(path, instance, file_format)
+            generated.append((size, file_format, path))
+    return generated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic facility location instances")
+    parser.add_argument("--sizes", nargs="+", default=SIZES, help="facilities x clients, e.g. 50x200")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--folder", default=OUTPUT_FOLDER)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args(argv)
+    for size, file_format, path in generate(args.sizes, args.formats, args.seed, args.folder, args.overwrite):
+        print(f"{size} ({file_format}): {path}")
+
+
+if __name__ == "__main__":
+    main()
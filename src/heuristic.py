@@ -2,12 +2,29 @@
 
 """
 
-from importer import Importer
-from network import Net, Action
-import os
-import copy
+from importer import Importer, BLOCK_SIZE
+from network import Net, Action, UNASSIGNED, DISCONNECT, load_solution
+from parallel import ClosurePool
+from instrument import logger, stats, enable_logging
+from bound import LagrangianBound
 import datetime
 import time
+import numpy as np
+
+# safety margin when comparing received demand with stored headrooms
+HEADROOM_TOLERANCE = 1e-9
+# largest difference between the stored and the executed balance of a closure
+BALANCE_TOLERANCE = 1e-6
+# local search: facilities in each client candidate list, passes limit and minimum improvement
+LOCAL_SEARCH_CANDIDATES = 10
+LOCAL_SEARCH_MAX_PASSES = 50
+IMPROVEMENT_TOLERANCE = 1e-9
+# default iterations budget of the savings loop
+MAX_ITERATION = 200
+# biased-randomized selection: probability of picking the best entry of the savings list
+SELECTION_BETA = 0.3
+# closures between checkpoints of the savings loop
+CHECKPOINT_EVERY = 10
 
 class Heuristic:
     """
@@ -19,35 +36,350 @@ class Heuristic:
     def execute(self):
         pass
 
-def dummy_greedy_net(data, name="dummy_1", how="greedy_cost"):
+class LocalSearch(Heuristic):
+    """
+    Class for improving client assignments within the open facilities
+    Moves (first improvement, applied in place on the net):
+        - shift: client to another open facility of its candidate list
+        - swap: two clients exchange facilities
+    Each client only considers its 'candidates' cheapest facilities (candidate lists),
+    and swap partners are the clients with the current facility of the client in their candidate list.
+    Cost and capacity deltas are computed from the net arrays in O(1) per move.
+    """
+    def __init__(self, net, candidates:int=LOCAL_SEARCH_CANDIDATES, max_passes:int=LOCAL_SEARCH_MAX_PASSES, deadline=None):
+        super().__init__(net)
+        self.max_passes = max_passes
+        # time.perf_counter value that stops the search (None: no time limit)
+        self.deadline = deadline
+        data = net.data
+        number_clients, number_facilities = data.costs.shape
+        # candidate lists (CSR-like): cheapest facilities of each client in cost order, and their costs
+        # (the first ones of the importer candidate lists in sparse mode)
+        if data.knn_indices is not None:
+            counts = np.diff(data.knn_indptr)
+            position = np.arange(data.knn_indices.size) - np.repeat(data.knn_indptr[:-1], counts)
+            kept = position < candidates
+            self.cand_indptr = np.concatenate(([0], np.cumsum(np.minimum(counts, candidates))))
+            self.cand_indices = data.knn_indices[kept]
+            self.cand_costs = data.knn_costs[kept]
+        else:
+            nearest, nearest_costs = Importer.nearest_facilities(data.costs, candidates)
+            self.cand_indptr = np.arange(0, nearest.size + 1, nearest.shape[1])
+            self.cand_indices = nearest.ravel()
+            self.cand_costs = nearest_costs.ravel()
+        # inverse candidate lists: clients with each facility in their candidate list, and their costs
+        flat_cli = np.repeat(np.arange(number_clients), np.diff(self.cand_indptr))
+        fac_order = np.argsort(self.cand_indices, kind="stable")
+        bounds = np.searchsorted(self.cand_indices[fac_order], np.arange(number_facilities + 1))
+        self.fac_cand_clients = np.split(flat_cli[fac_order], bounds[1:-1])
+        self.fac_cand_costs = np.split(self.cand_costs[fac_order], bounds[1:-1])
+        self.shifts = 0
+        self.swaps = 0
+
+    def shift(self, cli_idx:int) -> bool:
+        """
+        move the client to the first improving candidate facility
+        """
+        net = self.net
+        data = net.data
+        fac_from = net.assignment[cli_idx]
+        start, end = self.cand_indptr[cli_idx], self.cand_indptr[cli_idx + 1]
+        fac_to = self.cand_indices[start:end]
+        # deltas in float64 (costs may be float32 in out-of-core mode)
+        saving = float(data.costs[cli_idx, fac_from])
+        if net.client_count[fac_from] == 1:
+            # the facility is closed by the move
+            saving += data.cost_open[fac_from]
+        delta = self.cand_costs[start:end].astype(np.float64) - saving
+        feasible = ((fac_to != fac_from) & net.is_open[fac_to]
+                    & (net.load[fac_to] + data.demand[cli_idx] <= data.capacity[fac_to]))
+        improving = np.flatnonzero(feasible & (delta < -IMPROVEMENT_TOLERANCE))
+        if not improving.size:
+            return False
+        net.disconnect(cli_idx)
+        net.connect(cli_idx, int(fac_to[improving[0]]))
+        self.shifts += 1
+        return True
+
+    def swap(self, cli_idx:int) -> bool:
+        """
+        exchange the facility of the client with the first improving partner client
+        """
+        net = self.net
+        data = net.data
+        fac_a = net.assignment[cli_idx]
+        partners = self.fac_cand_clients[fac_a]
+        fac_b = net.assignment[partners]
+        valid = fac_b != fac_a
+        partners = partners[valid]
+        fac_b = fac_b[valid]
+        if not partners.size:
+            return False
+        # costs of the partners at fac_a: fac_a is one of their candidates
+        partner_costs = self.fac_cand_costs[fac_a][valid]
+        delta = (data.costs[cli_idx, fac_b].astype(np.float64) + partner_costs
+                 - data.costs[cli_idx, fac_a] - data.costs[partners, fac_b])
+        demand_diff = data.demand[partners] - data.demand[cli_idx]
+        feasible = ((net.load[fac_a] + demand_diff <= data.capacity[fac_a])
+                    & (net.load[fac_b] - demand_diff <= data.capacity[fac_b]))
+        improving = np.flatnonzero(feasible & (delta < -IMPROVEMENT_TOLERANCE))
+        if not improving.size:
+            return False
+        partner = int(partners[improving[0]])
+        fac_b = int(fac_b[improving[0]])
+        net.disconnect(cli_idx)
+        net.disconnect(partner)
+        net.connect(cli_idx, fac_b)
+        net.connect(partner, int(fac_a))
+        self.swaps += 1
+        return True
+
+    def execute(self):
+        """
+        run shift and swap passes over all clients until a pass finds no improvement
+        (or max_passes is reached), the net must be complete
+        """
+        net = self.net
+        if not net.is_complete():
+            return net
+        cost_ini = net.calc_cost()
+        with stats.timer("local_search"):
+            for _ in range(self.max_passes):
+                improved = False
+                for cli_idx in range(len(net.assignment)):
+                    if self.deadline is not None and time.perf_counter() > self.deadline:
+                        improved = False
+                        break
+                    if self.shift(cli_idx):
+                        improved = True
+                    elif self.swap(cli_idx):
+                        improved = True
+                if not improved:
+                    break
+            # drop rounding errors of the incremental updates
+            net.refresh_totals()
+        stats.count("shift_moves", self.shifts)
+        stats.count("swap_moves", self.swaps)
+        logger.info("> local search: %d shifts, %d swaps, balance %+f",
+                    self.shifts, self.swaps, net.calc_cost() - cost_ini)
+        return net
+
+def dummy_greedy_net(data, name="dummy_1", how="greedy_cost", order="index"):
     """
     create dummy greedy net that:
     1. is single-source - one facility per client
     2. is valid - demand restrictions are not violated
     3. greedy: the client minimum cost is used for assigning facilities
+    clients are assigned in the given order (see greedy_assignment)
+    in sparse mode (see Importer k_nearest) only the client candidate lists are searched first
     """
     net = Net(name, data)
+    with stats.timer("greedy_assignment"):
+        net.set_assignment(greedy_assignment(net, how, order))
+    logger.info("Greedy net created")
+    net.check()
+    return net
+
+def greedy_assignment(net, how="greedy_cost", order="index"):
+    """
+    capacity-aware greedy assignment: each client (in the given order) to its preferred facility
+    with enough capacity left ("greedy_cost": cheapest, "greedy_marginal": best ranked, see Net.find_fac_idx)
+    order: "index" (file order), "demand" (largest demand first) or a sequence of client positions
+    the preferred facility of every client is found at once, the facilities with enough
+    capacity are only searched when the preferred one is full
+    returns the assignment vector (facility positions)
+    """
+    data = net.data
+    number_clients = len(data.demand)
+    if isinstance(order, str):
+        if order == "index":
+            order = range(number_clients)
+        elif order == "demand":
+            order = np.argsort(-data.demand, kind="stable").tolist()
+        else:
+            raise ValueError(f"unknown client order: {order}")
+    preferred = preferred_facilities(data, how).tolist()
+    demands = data.demand.tolist()
+    capacity = data.capacity
+    load = np.zeros(len(data.facilities))
+    assignment = np.full(number_clients, UNASSIGNED, dtype=np.int64)
+    for cli_idx in order:
+        fac_idx = preferred[cli_idx]
+        demand = demands[cli_idx]
+        if load[fac_idx] + demand > capacity[fac_idx]:
+            stats.count("preferred_full")
+            fac_idx = net.find_fac_idx(cli_idx, load + demand <= capacity, how)
+            if fac_idx == UNASSIGNED:
+                raise ValueError(f"{data.clients[cli_idx]} cannot be assigned: no facility has enough capacity left")
+        load[fac_idx] += demand
+        assignment[cli_idx] = fac_idx
+    return assignment
+
+def preferred_facilities(data, how="greedy_cost"):
+    """
+    preferred facility (by position) of every client, vectorised Net.find_fac_idx with every facility allowed
+    """
+    if how == "greedy_cost":
+        matrix = data.costs
+    elif how == "greedy_marginal":
+        matrix = data.rank_matrix
+    else:
+        raise ValueError(f"unknown strategy: {how}")
+    number_clients, number_facilities = matrix.shape
+    if data.knn_indices is not None:
+        # candidate lists are sorted by cost
+        starts = data.knn_indptr[:-1]
+        if how == "greedy_cost":
+            return data.knn_indices[starts].astype(np.int64)
+        rows = np.repeat(np.arange(number_clients), np.diff(data.knn_indptr))
+        ranks = np.asarray(matrix[rows, data.knn_indices])
+        # best ranked candidate of each client (ties broken by cost order)
+        best = np.lexsort((ranks, rows))[starts]
+        return data.knn_indices[best].astype(np.int64)
+    preferred = np.empty(number_clients, dtype=np.int64)
+    rows = max(1, BLOCK_SIZE // max(number_facilities, 1))
+    for start in range(0, number_clients, rows):
+        preferred[start:start + rows] = np.argmin(np.asarray(matrix[start:start + rows]), axis=1)
+    return preferred
+
+def assign_clients(data, is_open):
+    """
+    capacity-aware greedy assignment of every client to the open facilities (boolean mask):
+    clients by decreasing regret (cost difference between their two cheapest open facilities),
+    then by decreasing demand, each one to its cheapest open facility with enough capacity left
+    returns the assignment vector (facility positions) or None if a client does not fit
+    """
+    open_idx = np.flatnonzero(is_open)
+    if not open_idx.size:
+        return None
+    costs = np.asarray(data.costs[:, open_idx])
+    if open_idx.size > 1:
+        two_smallest = np.partition(costs, 1, axis=1)[:, :2]
+        regret = two_smallest[:, 1] - two_smallest[:, 0]
+    else:
+        regret = np.zeros(len(data.demand))
+    order = np.lexsort((-data.demand, -regret))
+    remaining = data.capacity[open_idx].astype(float)
+    assignment = np.empty(len(data.demand), dtype=np.int64)
+    for cli_idx in order:
+        demand = data.demand[cli_idx]
+        fits = remaining >= demand
+        if not fits.any():
+            return None
+        position = int(np.argmin(np.where(fits, costs[cli_idx], np.inf)))
+        remaining[position] -= demand
+        assignment[cli_idx] = open_idx[position]
+    return assignment
+
+def add_facilities(data):
+    """
+    ADD: starting with every facility closed, open the facility with the best score until
+    no facility lowers the cost and the open facilities can serve every client
+    score of a closed facility (all of them at once): opening cost minus the assignment cost saved
+    by the clients that are cheaper to serve from it, scaled down if their demand exceeds its capacity
+    returns the open facilities mask and the assignment
+    """
+    costs = np.asarray(data.costs)
+    number_facilities = costs.shape[1]
+    total_demand = data.demand.sum()
+    is_open = np.zeros(number_facilities, dtype=bool)
+    # no facility open yet: every client at its most expensive facility
+    best = costs.max(axis=1)
+    while True:
+        gain = np.maximum(best[:, np.newaxis] - costs, 0.0)
+        served = data.demand @ (gain > 0)
+        scale = np.minimum(1.0, data.capacity / np.maximum(served, 1e-12))
+        score = data.cost_open - scale * gain.sum(axis=0)
+        score[is_open] = np.inf
+        candidate = int(np.argmin(score))
+        if data.capacity[is_open].sum() >= total_demand and score[candidate] >= 0:
+            assignment = assign_clients(data, is_open)
+            if assignment is not None:
+                return is_open, assignment
+        if is_open[candidate]:
+            # every facility is open
+            return is_open, assign_clients(data, is_open)
+        is_open[candidate] = True
+        best = np.minimum(best, costs[:, candidate])
+
+def drop_facilities(data):
+    """
+    DROP: starting with every facility open, close the facility with the best score while
+    it lowers the cost and the remaining capacity covers the total demand
+    score of an open facility (all of them at once): extra cost of moving its clients
+    to their second cheapest open facility minus its opening cost
+    only the clients whose cheapest or second cheapest facility was closed are updated
+    returns the open facilities mask and the assignment
+    """
+    costs = np.asarray(data.costs)
+    number_clients, number_facilities = costs.shape
+    total_demand = data.demand.sum()
+    is_open = np.ones(number_facilities, dtype=bool)
+    if number_facilities < 2:
+        return is_open, assign_clients(data, is_open)
+    rows = np.arange(number_clients)
+    two_smallest = np.argpartition(costs, 1, axis=1)[:, :2]
+    first, second = two_smallest[:, 0].copy(), two_smallest[:, 1].copy()
+    dropped = []
+    open_capacity = data.capacity.sum()
+    while len(dropped) < number_facilities - 1:
+        extra = costs[rows, second] - costs[rows, first]
+        score = np.bincount(first, weights=extra, minlength=number_facilities) - data.cost_open
+        score[~is_open] = np.inf
+        score[open_capacity - data.capacity < total_demand] = np.inf
+        candidate = int(np.argmin(score))
+        if score[candidate] >= 0:
+            break
+        is_open[candidate] = False
+        open_capacity -= data.capacity[candidate]
+        dropped.append(candidate)
+        changed = np.flatnonzero((first == candidate) | (second == candidate))
+        if is_open.sum() < 2:
+            first[changed] = np.argmax(is_open)
+            second[changed] = first[changed]
+            continue
+        masked = np.where(is_open, costs[changed], np.inf)
+        two_smallest = np.argpartition(masked, 1, axis=1)[:, :2]
+        swap = masked[np.arange(changed.size), two_smallest[:, 1]] < masked[np.arange(changed.size), two_smallest[:, 0]]
+        first[changed] = np.where(swap, two_smallest[:, 1], two_smallest[:, 0])
+        second[changed] = np.where(swap, two_smallest[:, 0], two_smallest[:, 1])
+    # single-source assignment may not fit: reopen the last dropped facilities
+    assignment = assign_clients(data, is_open)
+    while assignment is None and dropped:
+        is_open[dropped.pop()] = True
+        assignment = assign_clients(data, is_open)
+    return is_open, assignment
 
-    for client in data.clients:
-        feasible_fac = False
-        facility_list = copy.copy(net.data.facilities)
-        while not feasible_fac:
-            if how == "greedy_cost":
-                facility = net.find_fac_greedy_on_cost(client,facility_list)
-            if how == "greedy_marginal":
-                facility = net.find_fac_greedy_on_marginal_cost(client,facility_list)
-            act = Action(net).assign_cli_to_fac(client, facility)
-            feasible_fac = act.feasible
-            # print(facility_list)
-            # print(facility)
-            facility_list.remove(facility)
-        net = act.new_net
-    print(20*"*")
-    print("Greedy net created")
+def add_drop_net(data, name="add_drop_1", how="add"):
+    """
+    create a net with the vectorised ADD ("add") or DROP ("drop") construction
+    (see add_facilities and drop_facilities), clients are assigned with assign_clients
+    """
+    with stats.timer("add_drop"):
+        if how == "add":
+            is_open, assignment = add_facilities(data)
+        elif how == "drop":
+            is_open, assignment = drop_facilities(data)
+        else:
+            raise ValueError(f"unknown construction: {how}")
+    if assignment is None:
+        raise ValueError(f"{data.instance}: clients cannot be assigned within the facility capacities")
+    net = Net(name, data)
+    net.set_assignment(assignment)
     net.check()
-    print(20*"*")
+    net.calc_cost()
+    logger.info("%s net created: %d facilities open", how.upper(), int(net.is_open.sum()))
     return net
 
+def initial_net(data, name="initial", how="greedy_cost"):
+    """
+    create the initial net of savings_heur: ADD/DROP construction ("add", "drop")
+    or dummy greedy net ("greedy_cost", "greedy_marginal")
+    """
+    if how in ("add", "drop"):
+        return add_drop_net(data, name=name, how=how)
+    return dummy_greedy_net(data, name=name, how=how)
+
 def dummy_greedy_heur(how="greedy_cost"):
     """
     execute a greedy net heuristic based on input file
@@ -63,18 +395,112 @@ def dummy_greedy_heur(how="greedy_cost"):
     return net
 
 
-def calculate_savings(net, how="greedy_cost", verbose=True) -> dict:
+class SavingsList:
+    """
+    Class for keeping savings entries between savings_heur iterations
+    Each entry (by facility position) stores:
+        - balance: balance of closing the facility
+        - touched: facilities examined while simulating the closure
+        - headroom: spare capacity left in each facility that received clients in the simulation
+    """
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, fac_idx, balance, touched, headroom):
+        """
+        store the entry of a simulated closure
+        """
+        self.entries[fac_idx] = (balance, touched, headroom)
+
+    def discard(self, fac_idx):
+        """
+        drop the entry of a facility (it is simulated again by calculate_savings)
+        """
+        self.entries.pop(fac_idx, None)
+
+    def get_balance(self, facility):
+        """
+        balance of a stored entry (None if there is no entry)
+        """
+        entry = self.entries.get(facility.index)
+        return None if entry is None else entry[0]
+
+    def update(self, action):
+        """
+        drop the entries that an executed action could have changed:
+        - facilities that were closed can no longer receive clients,
+          so entries that assigned clients to them are dropped
+        - facilities that lost clients but are still open may accept clients they rejected before,
+          so entries that examined them are dropped
+        - facilities that received clients may reject clients they accepted before,
+          so entries are dropped if the received demand does not fit in their headroom,
+          and the headroom of the kept entries is reduced by the received demand
+          (demand received over several closures adds up)
+        """
+        net = action.net
+        data = net.data
+        released = set()
+        received = {}
+        for move, cli_idx, fac_idx in action.log:
+            if move == DISCONNECT:
+                released.add(fac_idx)
+                received[fac_idx] = received.get(fac_idx, 0.0) - data.demand[cli_idx]
+            else:
+                received[fac_idx] = received.get(fac_idx, 0.0) + data.demand[cli_idx]
+        received = {fac_idx: demand for fac_idx, demand in received.items() if demand > 0.0}
+        closed = {fac_idx for fac_idx in released if not net.is_open[fac_idx]}
+        released -= closed
+        entries = {}
+        for fac_idx, (balance, touched, headroom) in self.entries.items():
+            if fac_idx in received or fac_idx in closed:
+                continue
+            if not touched.isdisjoint(released) or not closed.isdisjoint(headroom):
+                continue
+            if any(demand > headroom[idx] - HEADROOM_TOLERANCE
+                   for idx, demand in received.items() if idx in headroom):
+                continue
+            if not headroom.keys().isdisjoint(received):
+                headroom = {idx: room - received.get(idx, 0.0) for idx, room in headroom.items()}
+            entries[fac_idx] = (balance, touched, headroom)
+        self.entries = entries
+
+def calculate_savings(net, how="greedy_cost", verbose=False, savings_list=None, pool=None, deadline=None) -> dict:
     """
     calculate savings list (dictionary)
-    TODO: sorted or biased randomized?
+    if a SavingsList is given, its entries are reused and only the missing ones are simulated
+    if a ClosurePool is given, the closures are simulated by its worker processes
+    the list is sorted by balance, see select_facility for picking the facility to close
+    with deadline (time.perf_counter value) the serial simulations stop when it is reached:
+    the list then only holds the facilities evaluated so far
     """
-    savings = {}
+    balances = {}
     # get open facilities
     open_facilities = net.get_open_facilities()
     # print(open_facilities)
-    for facility in open_facilities:
-        act_close = Action(net).close_facility(facility, how=how, verbose=False)
-        savings[facility] = act_close.balance
+    if savings_list is not None:
+        for facility in open_facilities:
+            balance = savings_list.get_balance(facility)
+            if balance is not None:
+                balances[facility.index] = balance
+    pending = [facility for facility in open_facilities if facility.index not in balances]
+    stats.count("closures_reused", len(balances))
+    stats.count("closures_simulated", len(pending))
+    if pool is not None and len(pending) > 1:
+        results = pool.evaluate(net, [facility.index for facility in pending], how)
+    else:
+        results = []
+        for facility in pending:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            act_close = Action(net).close_facility(facility, how=how, verbose=False)
+            results.append((facility.index, act_close.balance, act_close.touched, act_close.headroom()))
+            # evaluation only: restore the net
+            act_close.undo()
+    for fac_idx, balance, touched, headroom in results:
+        balances[fac_idx] = balance
+        if savings_list is not None:
+            savings_list.add(fac_idx, balance, touched, headroom)
+    savings = {facility: balances[facility.index] for facility in open_facilities if facility.index in balances}
     # sort list
     savings_sorted = dict(sorted(savings.items(), key=lambda item: item[1]))
     if verbose:
@@ -82,11 +508,38 @@ def calculate_savings(net, how="greedy_cost", verbose=True) -> dict:
 
     return savings_sorted
 
-def savings_heur(file_path="", initial="greedy_cost", save="greedy_cost", close="greedy_cost", verbose=False):
+def select_facility(savings, selection="sorted", beta=SELECTION_BETA, rng=None):
+    """
+    select the facility to close from the sorted savings list
+        - "sorted": entry with the best balance
+        - "biased": biased-randomized, the position among the improving entries (negative balance)
+          follows a geometric distribution truncated to the improving entries: P(k) ~ beta * (1 - beta)^k
+    """
+    facilities = list(savings.keys())
+    if selection == "sorted":
+        return facilities[0]
+    if selection != "biased":
+        raise ValueError(f"unknown selection: {selection}")
+    number_improving = sum(1 for balance in savings.values() if balance < -0.0)
+    if number_improving <= 1:
+        return facilities[0]
+    position = int(rng.geometric(beta)) - 1
+    while position >= number_improving:
+        position = int(rng.geometric(beta)) - 1
+    return facilities[position]
+
+def savings_heur(file_path="", initial="greedy_cost", save="greedy_cost", close="greedy_cost", verbose=False,
+                 incremental=True, workers=1, stats_file=None, local_search=True, data=None,
+                 selection="sorted", beta=SELECTION_BETA, seed=None,
+                 time_limit=None, max_iteration=MAX_ITERATION, callback=None,
+                 k_nearest=None, out_of_core=False,
+                 bound=False, lower_bound=None, gap_target=None,
+                 warm_start=None, solution_file=None, checkpoint_file=None, checkpoint_every=CHECKPOINT_EVERY):
     """
     execute the savings net heuristic based on input file
     PROCEDURE:
-    1. initial assignment
+    1. initial assignment: dummy greedy net ("greedy_cost", "greedy_marginal")
+       or ADD/DROP construction ("add", "drop")
     2. closing facilities loop
     2.1. calculate savings list
     2.2. checks 
@@ -94,6 +547,35 @@ def savings_heur(file_path="", initial="greedy_cost", save="greedy_cost", close=
     2.2.2. valid solution
     2.2.3. positive balance
     2.3. execute facility closure
+    save and close: "greedy_cost", "greedy_marginal" or "regret"
+    (clients relocated by decreasing regret, see Action.relocate_by_regret)
+    3. local search (shift and swap client moves), if local_search is set
+    with incremental=True the savings entries are kept between iterations
+    and only those affected by the last closure are simulated again
+    with workers > 1 the savings list closures are simulated in a pool of worker processes
+    with stats_file the timers and counters of the run are saved as JSON (see instrument.py)
+    with data (Importer) the instance is not imported again
+    with k_nearest the instance is imported in sparse mode: clients are only reassigned
+    to their k cheapest facilities, unless none of them is feasible (see Importer)
+    with out_of_core the cost matrices are memory-mapped float32 files (see Importer)
+    with selection="biased" the facility to close is sampled from the savings list (see select_facility)
+    using a random generator seeded with seed, so runs are reproducible
+    BUDGETS (anytime mode):
+    - time_limit: wall-clock seconds for the whole run (import included)
+    - max_iteration: maximum number of closures (None: no limit)
+    - callback(iteration, cost, elapsed): called after each closure, returning True stops the run
+    a closure is only executed when it is feasible and (with save == close) saves what the savings list promised,
+    so when a budget is hit the current net is the best feasible net found so far (net.stop_reason tells why the loop ended)
+    GAP:
+    - bound: calculate a Lagrangian lower bound after the initial assignment (see bound.py)
+    - lower_bound: known lower bound (e.g. calculated once for many runs), no bound is calculated
+    - gap_target: stop as soon as (cost - lower bound) / cost <= gap_target (implies bound)
+    the lower bound and the final gap are stored in net.lower_bound and net.calc_gap()
+    SOLUTIONS (see Net.save_solution):
+    - warm_start: net or solution file used as initial assignment instead of 'initial'
+      (e.g. a previous best-known solution or a checkpoint to resume)
+    - solution_file: the final solution is saved there
+    - checkpoint_file: the current solution is saved there every checkpoint_every closures
     """
     # folder = "Holmberg_Instances/"
     # folder = "OR-Library_Instances/"
@@ -105,58 +587,189 @@ def savings_heur(file_path="", initial="greedy_cost", save="greedy_cost", close=
     # instance = "30-200-1.dat"
     # file_path = "inputs/"+folder+subfolder+instance
 
-    if file_path == "":
-        # ask for instance input
-        data = Importer()
-    else:
-        data = Importer(file_path)
+    stats.reset()
+    start_time = time.perf_counter()
+    if data is None:
+        if file_path == "":
+            # ask for instance input
+            data = Importer(k_nearest=k_nearest, out_of_core=out_of_core)
+        else:
+            data = Importer(file_path, k_nearest=k_nearest, out_of_core=out_of_core)
     # create network name
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     output_name = data.instance_type+"_"+data.instance+"_"+timestamp
 
     # 1. initial assignment
-    print("""*** Initial assignment ***""")
-    net = dummy_greedy_net(data, name=output_name, how=initial)
+    logger.info("*** Initial assignment ***")
+    with stats.timer("initial_assignment"):
+        if warm_start is not None:
+            net = warm_start_net(data, warm_start, name=output_name)
+        else:
+            net = initial_net(data, name=output_name, how=initial)
+    deadline = None if time_limit is None else start_time + time_limit
+    if lower_bound is None and (bound or gap_target is not None):
+        lower_bound = LagrangianBound(data).solve(upper_bound=net.calc_cost(), gap_target=gap_target, deadline=deadline)
+    net.lower_bound = lower_bound
 
     # 2. closing facilities loop
-    max_iteration = 200
+    savings_list = SavingsList() if incremental else None
+    pool = ClosurePool(data, workers) if workers > 1 else None
+    rng = np.random.default_rng(seed)
+    params = {"initial": initial, "save": save, "close": close, "incremental": incremental, "workers": workers,
+              "local_search": local_search, "selection": selection, "beta": beta, "seed": seed,
+              "k_nearest": data.k_nearest, "out_of_core": out_of_core,
+              "warm_start": warm_start if isinstance(warm_start, str) else warm_start is not None}
+    checkpoint = None if checkpoint_file is None else (lambda net: net.save_solution(checkpoint_file, **params))
+    try:
+        net = savings_loop(net, save, close, verbose, savings_list, pool, max_iteration,
+                           selection=selection, beta=beta, rng=rng,
+                           deadline=deadline, callback=callback, start_time=start_time, gap_target=gap_target,
+                           checkpoint=checkpoint, checkpoint_every=checkpoint_every)
+    finally:
+        if pool is not None:
+            pool.close()
+
+    # 3. local search
+    if local_search and net.stop_reason not in ("time_limit", "callback", "gap"):
+        net = LocalSearch(net, deadline=deadline).execute()
+    net.calc_cost()
+
+    stats.add_time("savings_heur", time.perf_counter() - start_time)
+    # print(net.connection_matrix)
+    logger.info("%s", net)
+    if net.lower_bound is not None:
+        logger.info("> lower bound: %f, gap: %.2f%%", net.lower_bound, 100*net.calc_gap())
+    # net.draw_net()
+    if stats_file is not None:
+        stats.export(
+            stats_file,
+            instance_type=data.instance_type,
+            instance=data.instance,
+            params=params,
+            cost=net.total_cost,
+            iterations=net.iterations,
+            stop_reason=net.stop_reason,
+            lower_bound=net.lower_bound,
+            gap=net.calc_gap())
+    if solution_file is not None:
+        net.save_solution(solution_file, **params)
+    return net
+
+def warm_start_net(data, warm_start, name="warm_start"):
+    """
+    create a net from a previous solution: a net or a solution file (see Net.save_solution)
+    the solution must belong to the instance
+    """
+    if isinstance(warm_start, str):
+        net = load_solution(warm_start, data, name=name)
+        net.iterations = 0
+        net.stop_reason = ""
+        return net
+    if warm_start.data is not data and warm_start.data.instance_hash() != data.instance_hash():
+        raise ValueError(f"warm start {warm_start.id} is not a solution of {data.instance_type}/{data.instance}")
+    net = Net(name, data)
+    net.set_assignment(warm_start.assignment)
+    net.lower_bound = warm_start.lower_bound
+    net.check()
+    net.calc_cost()
+    return net
+
+def savings_loop(net, save, close, verbose, savings_list, pool, max_iteration,
+                 selection="sorted", beta=SELECTION_BETA, rng=None,
+                 deadline=None, callback=None, start_time=None, gap_target=None,
+                 checkpoint=None, checkpoint_every=CHECKPOINT_EVERY):
+    """
+    closing facilities loop of the savings heuristic
+    stops when no closure saves cost, a budget is hit or the gap target is reached (see savings_heur),
+    and sets net.stop_reason
+    checkpoint(net) is called every checkpoint_every closures
+    """
+    if start_time is None:
+        start_time = time.perf_counter()
     iteration = 0
+    # facilities the close strategy could not close in the current net (only when save != close)
+    excluded = set()
     while True:
+        if deadline is not None and time.perf_counter() > deadline:
+            logger.info("> time limit reached: %d iterations", iteration)
+            net.stop_reason = "time_limit"
+            break
+        if gap_target is not None and net.lower_bound is not None and net.calc_gap() <= gap_target:
+            logger.info("> gap target reached: %d iterations", iteration)
+            net.stop_reason = "gap"
+            break
         # 2.1. calculate savings list
         if verbose:
             print("""*** Calculating savings list ***""")
-        savings = calculate_savings(net, how=save)
+        with stats.timer("calculate_savings"):
+            savings = calculate_savings(net, how=save, verbose=verbose, savings_list=savings_list, pool=pool, deadline=deadline)
+        if excluded:
+            savings = {facility: balance for facility, balance in savings.items() if facility.index not in excluded}
+        if deadline is not None and time.perf_counter() > deadline:
+            # the savings list may be incomplete
+            logger.info("> time limit reached: %d iterations", iteration)
+            net.stop_reason = "time_limit"
+            break
         # 2.2. checks 
         if verbose:
             print("""*** Checking ***""")
         # 2.2.1. empty list
         if not savings:
-            print("> exiting: savings list is empty")
+            logger.info("> exiting: savings list is empty")
+            net.stop_reason = "empty"
             break
         # 2.2.2. valid solution
         if not net.check():
-            print("> exiting: net did not pass checks")
+            logger.info("> exiting: net did not pass checks")
+            net.stop_reason = "check"
             break
         # 2.2.3. positive balance of next facility
         if next(iter(savings.values())) > -0.0:
-            print("> exiting: cannot save more cost")
+            logger.info("> exiting: cannot save more cost")
+            net.stop_reason = "no_saving"
             break
         # 2.3. execute facility closure
         if verbose:
             print("""*** Closing facility ***""")
-        facility = next(iter(savings.keys()))
-        act_close = Action(net).close_facility(facility,how=close)
-        net = act_close.new_net
+        facility = select_facility(savings, selection, beta, rng)
+        with stats.timer("close"):
+            act_close = Action(net).close_facility(facility,how=close,verbose=verbose)
+            if not act_close.feasible and save != close:
+                # the savings of another strategy cannot be checked: skip the facility until the next closure
+                excluded.add(facility.index)
+                stats.count("closures_infeasible")
+                logger.info("> %s cannot be closed with %s", facility, close)
+                continue
+            if not act_close.feasible or (save == close and abs(act_close.balance - savings[facility]) > BALANCE_TOLERANCE):
+                # stale savings entry: roll back, simulate the closure again in the next iteration
+                act_close.undo()
+                if savings_list is not None:
+                    savings_list.discard(facility.index)
+                stats.count("closures_stale")
+                logger.warning("> stale saving of %s: %s instead of %s", facility, act_close.balance, savings[facility])
+                continue
+            net = act_close.new_net
+            excluded.clear()
+            if savings_list is not None:
+                savings_list.update(act_close)
+        # drop rounding errors of the evaluated moves
+        net.refresh_totals()
+        net.calc_cost()
         # safety loop break
         iteration += 1
-        print(f"> {iteration=} finished: {facility} was closed")
-        if iteration >= max_iteration:
-            print(f"> limit reached: {iteration} iterations")
+        net.iterations = iteration
+        stats.count("iterations")
+        logger.info("> iteration=%d finished: %s was closed", iteration, facility)
+        if checkpoint is not None and iteration % checkpoint_every == 0:
+            checkpoint(net)
+        if callback is not None and callback(iteration, net.total_cost, time.perf_counter() - start_time):
+            logger.info("> stopped by callback: %d iterations", iteration)
+            net.stop_reason = "callback"
+            break
+        if max_iteration is not None and iteration >= max_iteration:
+            logger.info("> limit reached: %d iterations", iteration)
+            net.stop_reason = "max_iteration"
             break
-
-    # print(net.connection_matrix)
-    print(net)
-    # net.draw_net()
     return net
 
 
@@ -197,27 +810,20 @@ def test_3():
     print(cli_pref)
 
 def loop_all():
-    output = {}
-    folder = "inputs/Holmberg_Instances/"
-    # root = "inputs/OR-Library_Instances/"
-    # root = "inputs/Yang_Instances/"
-    instances = [item for item in os.listdir(folder) if os.path.isfile(os.path.join(folder,item))]
-    instances = ["p25"]
-    # for instance in instances[:2]: # first N
-    # for instance in instances[18:]: # from N to end
-    for instance in instances:
-        path = folder+instance
-        start_time = time.time()
-        out_net = savings_heur(path, initial="greedy_marginal", save="greedy_marginal", close="greedy_marginal", verbose=True)
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        output[instance] = [out_net.total_cost, elapsed_time]
-        print("RESULTS")
-        for key, value in output.items():
-            print(f"{key},{value}")
+    """
+    run the savings heuristic on all Holmberg instances (see runner.py for other folders and strategies)
+    """
+    from runner import run_batch
+    run_batch(
+        ["inputs/Holmberg_Instances/"],
+        initial=["greedy_marginal"],
+        save=["greedy_marginal"],
+        close=["greedy_marginal"],
+        output="out/results_Holmberg_Instances.csv")
 
 
 if __name__ == "__main__":
+    enable_logging()
     # dummy_greedy_heur(how="greedy_marginal")
     # savings_heur(initial="greedy_cost", save="greedy_cost", close="greedy_cost")
     # savings_heur(initial="greedy_marginal", save="greedy_marginal", close="greedy_marginal")
@@ -3,33 +3,174 @@
 
 from facility import Facility
 from client import Client
+from instrument import logger, stats, enable_logging
+import gzip
+import hashlib
 import os
 import sys
+import zipfile
+import numpy as np
 import pandas as pd
 
+READ_CHUNK_SIZE = 1 << 22
+CACHE_FOLDER = ".cache"
+CACHE_VERSION = 2
+# out-of-core mode: memory-mapped arrays (file suffix and dtype) and elements processed per block
+MMAP_ARRAYS = {
+    "costs": (".costs.npy", np.float32),
+    "marginal": (".marginal.npy", np.float32),
+    "rank_matrix": (".rank.npy", np.int32),
+}
+MMAP_META_SUFFIX = ".mmap.npz"
+BLOCK_SIZE = 1 << 22
+
+
+class TokenStream:
+    """
+    Class for reading consecutive groups of numbers from the chunks of Importer.iter_tokens
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = np.empty(0)
+
+    def blocks(self, count:int):
+        """
+        yield the next 'count' numbers as consecutive arrays (at most one chunk in memory)
+        """
+        while count > 0:
+            if not self.buffer.size:
+                self.buffer = next(self.chunks, None)
+                if self.buffer is None:
+                    raise ValueError(f"expected {count} more values")
+            block, self.buffer = self.buffer[:count], self.buffer[count:]
+            count -= block.size
+            yield block
+
+    def take(self, count:int):
+        """
+        next 'count' numbers as one array
+        """
+        blocks = list(self.blocks(count))
+        return np.concatenate(blocks) if blocks else np.empty(0)
+
 class Importer():
     """
     Class to handle bechmark data import
     """
-    def __init__(self,import_file_path=""):
+    def __init__(self,import_file_path="", use_cache=True, k_nearest=None, out_of_core=False):
+        """
+        k_nearest: if set, each client keeps a candidate list of its k cheapest facilities
+        (sparse mode, see calculate_candidates)
+        out_of_core: costs, marginal costs and ranks are float32/int32 memory-mapped files
+        in the cache folder, written once and read from disk (see import_file_out_of_core)
+        """
+        self.init_data(import_file_path, use_cache)
+
+        if self.import_file_path == "":
+            self.import_file_path = self.instance_selector()
+        self.instance_type, self.instance = self.parse_instance_path(self.import_file_path)
+        if self.use_cache or out_of_core:
+            self.source_hash = self.calculate_source_hash()
+        with stats.timer("import"):
+            if out_of_core:
+                if not (self.use_cache and self.load_mmap()):
+                    self.import_file_out_of_core()
+                    self.load_mmap()
+            elif not (self.use_cache and self.load_cache()):
+                self.import_file()
+                self.calculate_marginal_cost()
+                self.calculate_rank_matrix()
+                if self.use_cache:
+                    self.save_cache()
+            if k_nearest:
+                self.calculate_candidates(k_nearest)
+
+    @classmethod
+    def from_arrays(cls, arrays, instance_type="", instance="", import_file_path="", source_hash=""):
+        """
+        Create an importer from already parsed arrays, no file is read
+        arrays (dict): capacity, cost_open, demand, costs and optionally marginal, rank_matrix
+        and the candidate lists (knn_indptr, knn_indices and optionally knn_costs)
+        """
+        data = cls.__new__(cls)
+        data.init_data(import_file_path, use_cache=False)
+        data.instance_type = instance_type
+        data.instance = instance
+        data.source_hash = source_hash
+        data.capacity = arrays["capacity"]
+        data.cost_open = arrays["cost_open"]
+        data.demand = arrays["demand"]
+        data.costs = arrays["costs"]
+        data.build_instance()
+        if "marginal" in arrays:
+            data.marginal = arrays["marginal"]
+        else:
+            data.calculate_marginal_cost()
+        if "rank_matrix" in arrays:
+            data.rank_matrix = arrays["rank_matrix"]
+        else:
+            data.calculate_rank_matrix()
+        if "knn_indices" in arrays:
+            data.knn_indptr = arrays["knn_indptr"]
+            data.knn_indices = arrays["knn_indices"]
+            counts = np.diff(data.knn_indptr)
+            if "knn_costs" in arrays:
+                data.knn_costs = arrays["knn_costs"]
+            else:
+                rows = np.repeat(np.arange(counts.size), counts)
+                data.knn_costs = np.asarray(data.costs[rows, data.knn_indices])
+            data.k_nearest = int(counts.max()) if counts.size else 0
+        return data
+
+    @staticmethod
+    def parse_instance_path(import_file_path):
+        """
+        get instance type and instance name from the instance path
+        instance type: folder named '*_Instances' (parent folder if there is none), e.g.:
+            inputs/Holmberg_Instances/p1 -> (Holmberg_Instances, p1)
+            inputs/Yang_Instances/30-200/30-200-1.dat -> (Yang_Instances, 30-200-1.dat)
+        """
+        parts = os.path.normpath(import_file_path).split(os.sep)
+        instance = parts[-1]
+        if instance.endswith(".gz"):
+            instance = instance[:-len(".gz")]
+        instance_types = [part for part in parts[:-1] if part.endswith("_Instances")]
+        if instance_types:
+            instance_type = instance_types[-1]
+        else:
+            instance_type = parts[-2] if len(parts) > 1 else ""
+        return instance_type, instance
+
+    def init_data(self, import_file_path, use_cache):
+        """
+        Initialize empty instance data
+        """
         self.import_file_path = import_file_path
+        self.use_cache = use_cache
+        self.source_hash = ""
+        self.instance_type = ""
+        self.instance = ""
 
         self.facilities = []
         self.clients = []
-        self.cost_matrix = pd.DataFrame()
-        self.marginal_cost_matrix = pd.DataFrame()
+        self.capacity = np.empty(0)
+        self.cost_open = np.empty(0)
+        self.demand = np.empty(0)
+        self.costs = np.empty((0, 0))
+        self.marginal = np.empty((0, 0))
+        self.rank_matrix = np.empty((0, 0), dtype=np.int32)
+        # cost and marginal cost data frames, created on first use (see cost_matrix)
+        self.frames = {}
+        # sparse mode: candidate facilities of each client and their costs (CSR-like, see calculate_candidates)
+        self.k_nearest = None
+        self.knn_indptr = None
+        self.knn_indices = None
+        self.knn_costs = None
 
         self.fac_dict = dict()
         self.cli_dict = dict()
 
         self.status = False
-
-        if self.import_file_path == "":
-            self.import_file_path = self.instance_selector()
-        self.instance_type = self.import_file_path.split("/")[1]
-        self.instance = self.import_file_path.split("/")[2]
-        self.import_file()
-        self.calculate_marginal_cost()
     
     def get_input(self, values, question):
         """
@@ -85,6 +226,40 @@ class Importer():
 
 
 
+    def iter_tokens(self):
+        """
+        Read the instance file in chunks of READ_CHUNK_SIZE bytes
+        gzip-compressed files ('.gz') are decompressed while streaming
+        Yields arrays with the numbers of each chunk
+        """
+        if self.import_file_path.endswith(".gz"):
+            file = gzip.open(self.import_file_path, "rb")
+        else:
+            file = open(self.import_file_path, "rb")
+        rest = b""
+        with file:
+            while True:
+                block = file.read(READ_CHUNK_SIZE)
+                if not block:
+                    break
+                block = rest + block
+                numbers = block.split()
+                # keep the last number if it may continue in the next block
+                rest = b"" if block[-1:].isspace() or not numbers else numbers.pop()
+                yield np.array(numbers, dtype=float)
+        if rest:
+            yield np.array([rest], dtype=float)
+
+    def read_tokens(self):
+        """
+        Read the whole instance file in one pass
+        Returns a flat array with all the numbers of the file
+        """
+        chunks = list(self.iter_tokens())
+        if not chunks:
+            return np.empty(0)
+        return np.concatenate(chunks)
+
     def import_file(self):
         """
         Import data from the given path
@@ -93,91 +268,386 @@ class Importer():
         2. clientes (list)
         3. cost matrix (data frame)
         """
-        print(20*"*")
-        with open(self.import_file_path, "r") as file:
-            print(f"reading: {self.import_file_path}")
-            print(f"instance type: {self.instance_type}")
-            # read block 1: number of facilities and clients 
-            block_1 = file.readline().strip()
-            number_facilities, number_clients = [int(number) for number in block_1.split()]
-            print(f"number of facilities: {number_facilities}")
-            print(f"number of clients: {number_clients}")
-            # read block 2: facilities capacities and open costs
-            print("> parsing facilities")
-            for id in range(1, number_facilities+1):
-                sub_block_2 = file.readline().strip()
-                capacity_i, open_cost_i = [float(number) for number in sub_block_2.split()]
-                facility = Facility(id, capacity_i, open_cost_i)
-                self.facilities.append(facility)
-                self.fac_dict[id] = facility
-            # read block 3: client demands
-            print("> parsing clients")
-            n_client = 1
-            while n_client < number_clients + 1:
-                sub_block_3 = file.readline().strip()
-                demands = [float(number) for number in sub_block_3.split()]
-                for demand in demands:
-                    client = Client(n_client, demand)
-                    self.clients.append(client)
-                    self.cli_dict[n_client] = client
-                    n_client += 1
-            # read block 4: client-facility costs
-            print("> creating cost matrix")
-            if self.instance_type == "Holmberg_Instances":
-                for client in range(1, number_clients + 1):
-                    facilities = [facility for facility in range(1, number_facilities + 1)]
-                    sub_block_4 = file.readline().strip()
-                    costs = [float(number) for number in sub_block_4.split()]
-                    while len(costs) < len(facilities):
-                        sub_block_n = file.readline().strip()
-                        costs.extend([float(number) for number in sub_block_n.split()])
-                    # print(costs)
-                    # print(client)
-                    # print(facilities)
-                    client_costs = pd.DataFrame([costs], index=[client], columns=facilities)
-                    self.cost_matrix = pd.concat([self.cost_matrix, client_costs])
-            else:
-                for facility in range(1, number_facilities + 1):
-                    clients = [client for client in range(1, number_clients + 1)]
-                    # facilities = [facility for facility in range(1, number_facilities + 1)]
-                    sub_block_4 = file.readline().strip()
-                    costs = [float(number) for number in sub_block_4.split()]
-                    if len(costs) < number_clients:
-                        sub_block_n = file.readline().strip()
-                        costs.extend([float(number) for number in sub_block_n.split()])
-                    client_costs = pd.DataFrame([costs], index=[facility], columns=clients)
-                    self.cost_matrix = pd.concat([self.cost_matrix, client_costs])
-                self.cost_matrix = self.cost_matrix.transpose()
-
-            print(f"cost matrix created: {self.cost_matrix.shape}")
-        print("importer end")
-        print(20*"*")
+        logger.info("reading: %s", self.import_file_path)
+        logger.info("instance type: %s", self.instance_type)
+        tokens = self.read_tokens()
+        # read block 1: number of facilities and clients
+        number_facilities, number_clients = int(tokens[0]), int(tokens[1])
+        logger.info("number of facilities: %d", number_facilities)
+        logger.info("number of clients: %d", number_clients)
+        expected = 2 + 2*number_facilities + number_clients + number_facilities*number_clients
+        if tokens.size < expected:
+            raise ValueError(f"{self.import_file_path}: expected {expected} values, found {tokens.size}")
+        # read block 2: facilities capacities and open costs
+        start = 2
+        block_2 = tokens[start:start + 2*number_facilities].reshape(number_facilities, 2)
+        self.capacity = block_2[:, 0].copy()
+        self.cost_open = block_2[:, 1].copy()
+        # read block 3: client demands
+        start += 2*number_facilities
+        self.demand = tokens[start:start + number_clients].copy()
+        # read block 4: client-facility costs
+        start += number_clients
+        block_4 = tokens[start:start + number_facilities*number_clients]
+        if self.instance_type == "Holmberg_Instances":
+            self.costs = block_4.reshape(number_clients, number_facilities)
+        else:
+            self.costs = np.ascontiguousarray(block_4.reshape(number_facilities, number_clients).T)
+
+        self.build_instance()
+
+    def build_instance(self):
+        """
+        Create facilities and clients from the parsed arrays
+        """
+        number_facilities = self.capacity.size
+        number_clients = self.demand.size
+        logger.debug("> parsing facilities")
+        for id in range(1, number_facilities+1):
+            facility = Facility(id, self.capacity[id-1].item(), self.cost_open[id-1].item(), index=id-1)
+            self.facilities.append(facility)
+            self.fac_dict[id] = facility
+        logger.debug("> parsing clients")
+        for id in range(1, number_clients+1):
+            client = Client(id, self.demand[id-1].item(), index=id-1)
+            self.clients.append(client)
+            self.cli_dict[id] = client
+        self.frames = {}
+        logger.info("cost matrix created: %s", self.costs.shape)
+
+    @property
+    def cost_matrix(self) -> pd.DataFrame:
+        """
+        cost matrix data frame (clients x facilities, by id), created on first use
+        """
+        if "cost" not in self.frames:
+            self.frames["cost"] = self.build_frame(self.costs)
+        return self.frames["cost"]
+
+    @property
+    def marginal_cost_matrix(self) -> pd.DataFrame:
+        """
+        marginal cost matrix data frame (clients x facilities, by id), created on first use
+        """
+        if "marginal" not in self.frames:
+            self.frames["marginal"] = self.build_frame(self.marginal)
+        return self.frames["marginal"]
+
+    def build_frame(self, array) -> pd.DataFrame:
+        """
+        data frame of a clients x facilities array (index: client ids, columns: facility ids)
+        """
+        number_clients, number_facilities = array.shape
+        return pd.DataFrame(
+            np.asarray(array),
+            index=list(range(1, number_clients + 1)),
+            columns=list(range(1, number_facilities + 1)))
 
     def calculate_marginal_cost(self):
         """
         calculate marginal cost matrix
         marginal cost: difference between the cost associated with facility and second best facility
+        the smallest and second smallest cost of each row are computed once:
+        the minimum of a row except a given column is the smallest cost,
+        unless that column holds it, in which case it is the second smallest
         """
-        print("Calculating marginal cost matrix ...")
-        new_row_df_list = []
-        row_indices = []
-        for row_index, row in self.cost_matrix.iterrows():
-            new_row = {}
-            for col_index, col in row.items():
-                # get minimum in row except current
-                filtered_row = row[(row.index != col_index)]
-                min_in_row = filtered_row.min()
-                # substract current to minimum
-                marginal_cost = min_in_row - col
-                new_row[col_index] = [marginal_cost]
-            new_row_df = pd.DataFrame.from_dict(new_row)
-            new_row_df_list.append(new_row_df)
-            row_indices.append(row_index)
-        self.marginal_cost_matrix = pd.concat(new_row_df_list, ignore_index=True)
-        self.marginal_cost_matrix.index = row_indices
+        logger.debug("Calculating marginal cost matrix ...")
+        self.marginal = self.marginal_rows(self.costs)
+        self.frames.pop("marginal", None)
         # print(self.marginal_cost_matrix)
-        print("marginal cost matrix created")
-        print(20*"*")
+        logger.info("marginal cost matrix created")
+
+    @staticmethod
+    def marginal_rows(costs):
+        """
+        marginal costs of the given cost rows (any block of clients)
+        """
+        number_clients, number_facilities = costs.shape
+        if number_facilities < 2:
+            # there is no other facility to compare with
+            return np.full(costs.shape, np.nan, dtype=costs.dtype)
+        two_smallest_idx = np.argpartition(costs, 1, axis=1)[:, :2]
+        two_smallest = np.take_along_axis(costs, two_smallest_idx, axis=1)
+        marginal = two_smallest[:, [0]] - costs
+        rows = np.arange(number_clients)
+        best_idx = two_smallest_idx[:, 0]
+        marginal[rows, best_idx] = two_smallest[:, 1] - two_smallest[:, 0]
+        return marginal
+
+    def calculate_rank_matrix(self):
+        """
+        calculate facility preference rank matrix
+        rank_matrix[client, facility]: position of the client in the preference list of the facility,
+        clients sorted by decreasing marginal cost (ties broken by client order)
+        """
+        self.rank_matrix = self.rank_columns(self.marginal)
+
+    @staticmethod
+    def rank_columns(marginal):
+        """
+        preference ranks of the given marginal cost columns (any block of facilities)
+        """
+        number_clients, number_facilities = marginal.shape
+        order = np.argsort(-marginal, axis=0, kind="stable")
+        rank_matrix = np.empty((number_clients, number_facilities), dtype=np.int32)
+        columns = np.arange(number_facilities)
+        rank_matrix[order, columns] = np.arange(number_clients, dtype=np.int32)[:, np.newaxis]
+        return rank_matrix
+
+    @staticmethod
+    def nearest_facilities(costs, k:int):
+        """
+        k cheapest facilities of each client and their costs (clients x k arrays),
+        sorted by cost (ties broken by facility order)
+        the costs are processed in blocks of clients (they may be memory-mapped)
+        """
+        number_clients, number_facilities = costs.shape
+        k = max(1, min(k, number_facilities))
+        nearest = np.empty((number_clients, k), dtype=np.int64)
+        nearest_costs = np.empty((number_clients, k), dtype=costs.dtype)
+        rows = max(1, BLOCK_SIZE // max(number_facilities, 1))
+        for start in range(0, number_clients, rows):
+            block = np.asarray(costs[start:start + rows])
+            if k < number_facilities:
+                block_nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+                block_nearest.sort(axis=1)
+            else:
+                block_nearest = np.tile(np.arange(number_facilities), (block.shape[0], 1))
+            block_costs = np.take_along_axis(block, block_nearest, axis=1)
+            order = np.argsort(block_costs, axis=1, kind="stable")
+            nearest[start:start + rows] = np.take_along_axis(block_nearest, order, axis=1)
+            nearest_costs[start:start + rows] = np.take_along_axis(block_costs, order, axis=1)
+        return nearest, nearest_costs
+
+    def calculate_candidates(self, k:int):
+        """
+        calculate the candidate lists of the sparse mode: k cheapest facilities of each client
+        stored as compact CSR-like arrays, candidates of client i (sorted by cost) and their costs:
+            knn_indices[knn_indptr[i]:knn_indptr[i+1]], knn_costs[knn_indptr[i]:knn_indptr[i+1]]
+        the sparse paths only read these arrays, the cost matrix is read when a client falls back
+        to the full facility list (with out_of_core it stays on disk)
+        """
+        nearest, nearest_costs = self.nearest_facilities(self.costs, k)
+        number_clients, self.k_nearest = nearest.shape
+        self.knn_indices = nearest.astype(np.int32).ravel()
+        self.knn_costs = nearest_costs.ravel()
+        self.knn_indptr = np.arange(0, number_clients*self.k_nearest + 1, self.k_nearest, dtype=np.int64)
+        logger.info("candidate lists created: %d facilities per client", self.k_nearest)
+
+    def get_candidates(self, cli_idx:int):
+        """
+        candidate facilities (by position, sorted by cost) of a client in sparse mode
+        returns None if the candidate lists were not calculated
+        """
+        if self.knn_indices is None:
+            return None
+        return self.knn_indices[self.knn_indptr[cli_idx]:self.knn_indptr[cli_idx + 1]]
+
+    def get_candidate_costs(self, cli_idx:int):
+        """
+        costs of the candidate facilities of a client in sparse mode (same order as get_candidates)
+        returns None if the candidate lists were not calculated
+        """
+        if self.knn_costs is None:
+            return None
+        return self.knn_costs[self.knn_indptr[cli_idx]:self.knn_indptr[cli_idx + 1]]
+
+    def cache_path(self) -> str:
+        """
+        path of the binary cache of the instance: '.cache' folder next to the instance file
+        """
+        folder, file_name = os.path.split(self.import_file_path)
+        return os.path.join(folder, CACHE_FOLDER, file_name + ".npz")
+
+    def calculate_source_hash(self) -> str:
+        """
+        content hash (sha256) of the instance file
+        """
+        source_hash = hashlib.sha256()
+        with open(self.import_file_path, "rb") as file:
+            for block in iter(lambda: file.read(READ_CHUNK_SIZE), b""):
+                source_hash.update(block)
+        return source_hash.hexdigest()
+
+    def instance_hash(self) -> str:
+        """
+        content hash of the instance: hash of the instance file (source_hash),
+        or of the parsed arrays if the instance was not read from a file
+        """
+        if not self.source_hash:
+            if os.path.isfile(self.import_file_path):
+                self.source_hash = self.calculate_source_hash()
+            else:
+                source_hash = hashlib.sha256()
+                for array in (self.capacity, self.cost_open, self.demand):
+                    source_hash.update(np.ascontiguousarray(array).tobytes())
+                number_clients, number_facilities = self.costs.shape
+                rows = max(1, BLOCK_SIZE // max(number_facilities, 1))
+                for start in range(0, number_clients, rows):
+                    source_hash.update(np.ascontiguousarray(self.costs[start:start + rows]).tobytes())
+                self.source_hash = "arrays:" + source_hash.hexdigest()
+        return self.source_hash
+
+    def load_cache(self) -> bool:
+        """
+        Load parsed arrays and marginal cost matrix from the binary cache
+        Returns False if there is no cache or it does not match the instance file
+        """
+        path = self.cache_path()
+        if not os.path.isfile(path):
+            return False
+        try:
+            with np.load(path) as cache:
+                if (int(cache["version"]) != CACHE_VERSION
+                        or str(cache["source_hash"]) != self.source_hash
+                        or str(cache["instance_type"]) != self.instance_type):
+                    logger.info("outdated cache: %s", path)
+                    return False
+                self.capacity = cache["capacity"]
+                self.cost_open = cache["cost_open"]
+                self.demand = cache["demand"]
+                self.costs = cache["costs"]
+                self.marginal = cache["marginal"]
+                self.rank_matrix = cache["rank_matrix"]
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            logger.warning("invalid cache: %s", path)
+            return False
+        logger.info("reading cache: %s", path)
+        self.build_instance()
+        return True
+
+    def save_cache(self):
+        """
+        Save parsed arrays and marginal cost matrix to the binary cache
+        """
+        path = self.cache_path()
+        temp_path = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as file:
+                np.savez(
+                    file,
+                    version=CACHE_VERSION,
+                    source_hash=self.source_hash,
+                    instance_type=self.instance_type,
+                    capacity=self.capacity,
+                    cost_open=self.cost_open,
+                    demand=self.demand,
+                    costs=self.costs,
+                    marginal=self.marginal,
+                    rank_matrix=self.rank_matrix)
+            os.replace(temp_path, path)
+        except OSError as error:
+            logger.warning("cache not saved: %s", error)
+            return
+        logger.info("cache saved: %s", path)
+
+    def mmap_paths(self) -> dict:
+        """
+        paths of the out-of-core files in the cache folder: one .npy file per memory-mapped array
+        and a meta file (source hash and small arrays) written last
+        """
+        folder, file_name = os.path.split(self.import_file_path)
+        base = os.path.join(folder, CACHE_FOLDER, file_name)
+        paths = {name: base + suffix for name, (suffix, _) in MMAP_ARRAYS.items()}
+        paths["meta"] = base + MMAP_META_SUFFIX
+        return paths
+
+    def import_file_out_of_core(self):
+        """
+        Import data from the given path into memory-mapped files (out-of-core mode)
+        The file is streamed: costs are written to disk chunk by chunk, marginal costs
+        by blocks of clients and ranks by blocks of facilities, so the memory used
+        does not grow with the instance size
+        """
+        logger.info("reading (out-of-core): %s", self.import_file_path)
+        logger.info("instance type: %s", self.instance_type)
+        paths = self.mmap_paths()
+        os.makedirs(os.path.dirname(paths["meta"]), exist_ok=True)
+        stream = TokenStream(self.iter_tokens())
+        try:
+            # read block 1: number of facilities and clients
+            number_facilities, number_clients = [int(value) for value in stream.take(2)]
+            logger.info("number of facilities: %d", number_facilities)
+            logger.info("number of clients: %d", number_clients)
+            # read block 2: facilities capacities and open costs
+            block_2 = stream.take(2*number_facilities).reshape(number_facilities, 2)
+            capacity = block_2[:, 0].copy()
+            cost_open = block_2[:, 1].copy()
+            # read block 3: client demands
+            demand = stream.take(number_clients)
+            # read block 4: client-facility costs
+            arrays = {
+                name: np.lib.format.open_memmap(
+                    paths[name] + ".tmp", mode="w+", dtype=dtype, shape=(number_clients, number_facilities))
+                for name, (_, dtype) in MMAP_ARRAYS.items()}
+            costs = arrays["costs"]
+            position = 0
+            for block in stream.blocks(number_facilities*number_clients):
+                if self.instance_type == "Holmberg_Instances":
+                    # one row per client: same layout as the file
+                    costs.reshape(-1)[position:position + block.size] = block
+                else:
+                    # one row per facility
+                    fac_idx, cli_idx = np.divmod(np.arange(position, position + block.size), number_clients)
+                    costs[cli_idx, fac_idx] = block
+                position += block.size
+        except ValueError as error:
+            raise ValueError(f"{self.import_file_path}: {error}") from None
+        rows = max(1, BLOCK_SIZE // max(number_facilities, 1))
+        for start in range(0, number_clients, rows):
+            arrays["marginal"][start:start + rows] = self.marginal_rows(np.asarray(costs[start:start + rows]))
+        columns = max(1, BLOCK_SIZE // max(number_clients, 1))
+        for start in range(0, number_facilities, columns):
+            marginal = np.asarray(arrays["marginal"][:, start:start + columns])
+            arrays["rank_matrix"][:, start:start + columns] = self.rank_columns(marginal)
+        for array in arrays.values():
+            array.flush()
+        arrays.clear()
+        del costs
+        for name in MMAP_ARRAYS:
+            os.replace(paths[name] + ".tmp", paths[name])
+        with open(paths["meta"] + ".tmp", "wb") as file:
+            np.savez(
+                file,
+                version=CACHE_VERSION,
+                source_hash=self.source_hash,
+                instance_type=self.instance_type,
+                capacity=capacity,
+                cost_open=cost_open,
+                demand=demand)
+        os.replace(paths["meta"] + ".tmp", paths["meta"])
+        logger.info("memory-mapped files saved: %s", os.path.dirname(paths["meta"]))
+
+    def load_mmap(self) -> bool:
+        """
+        Load the small arrays and map the cost, marginal and rank files (read only) of the out-of-core mode
+        Returns False if the files are missing or do not match the instance file
+        """
+        paths = self.mmap_paths()
+        if not os.path.isfile(paths["meta"]):
+            return False
+        try:
+            with np.load(paths["meta"]) as meta:
+                if (int(meta["version"]) != CACHE_VERSION
+                        or str(meta["source_hash"]) != self.source_hash
+                        or str(meta["instance_type"]) != self.instance_type):
+                    logger.info("outdated memory-mapped files: %s", paths["meta"])
+                    return False
+                self.capacity = meta["capacity"]
+                self.cost_open = meta["cost_open"]
+                self.demand = meta["demand"]
+            for name in MMAP_ARRAYS:
+                setattr(self, name, np.load(paths[name], mmap_mode="r"))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            logger.warning("invalid memory-mapped files: %s", paths["meta"])
+            return False
+        if self.costs.shape != (self.demand.size, self.capacity.size):
+            logger.warning("invalid memory-mapped files: %s", paths["meta"])
+            return False
+        logger.info("mapping files: %s", os.path.dirname(paths["meta"]))
+        self.build_instance()
+        return True
 
 if __name__ == "__main__":
     folder = "Holmberg_Instances/"
@@ -187,6 +657,7 @@ if __name__ == "__main__":
     # instance = "cap61"
     # instance = "30-200-1"
     file_path = "inputs/"+folder+instance
+    enable_logging()
     data = Importer(file_path)
     # data = Importer()
     # print(data.cost_matrix)
@@ -0,0 +1,88 @@
+"""
+Solver instrumentation
+    - logger: solver messages, silent unless logging is enabled (see enable_logging);
+      messages use lazy %-formatting so disabled messages cost almost nothing
+    - stats: per-phase timers and counters of the current run, exportable as JSON
+"""
+
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger("cflp")
+logger.addHandler(logging.NullHandler())
+
+
+def enable_logging(level=logging.INFO):
+    """
+    print solver messages of the given level (and above) to stdout
+    """
+    if not any(getattr(handler, "cflp_handler", False) for handler in logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler.cflp_handler = True
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+class Stats:
+    """
+    Class for collecting timers and counters of a solver run
+        - counters: name -> count
+        - timers: name -> [total seconds, calls]
+    """
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.start_time = time.perf_counter()
+
+    def reset(self):
+        self.counters = {}
+        self.timers = {}
+        self.start_time = time.perf_counter()
+
+    def count(self, name:str, value:int=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name:str, elapsed:float):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [elapsed, 1]
+        else:
+            timer[0] += elapsed
+            timer[1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name:str):
+        """
+        time the enclosed block (phase)
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def summary(self) -> dict:
+        return {
+            "elapsed": time.perf_counter() - self.start_time,
+            "counters": dict(self.counters),
+            "timers": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.timers.items()},
+        }
+
+    def export(self, path:str, **info):
+        """
+        write the summary (plus any extra information) as JSON
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "w") as file:
+            json.dump({**info, **self.summary()}, file, indent=2)
+
+
+# stats of the current run (one per process)
+stats = Stats()
@@ -0,0 +1,157 @@
+"""
+Multi-start savings heuristic
+Runs many seeded biased-randomized savings_heur runs (see select_facility) on a pool of
+worker processes that share the parsed instance (see parallel.SharedInstance),
+and returns the best solution found with the seed of every run, so any run can be reproduced with
+    savings_heur(path, selection="biased", beta=beta, seed=seed)
+
+usage:
+    python src/multistart.py inputs/Holmberg_Instances/p13 --runs 32 --workers 8 --seed 1
+"""
+
+from importer import Importer
+from network import Net
+from heuristic import savings_heur, initial_net, SELECTION_BETA
+from parallel import SharedInstance, init_worker, worker_state
+from bound import LagrangianBound
+from instrument import logger
+import argparse
+import functools
+import multiprocessing
+import os
+import time
+
+
+def run_start(seed, params, data=None) -> dict:
+    """
+    Run one start of the savings heuristic (seed None: deterministic sorted selection)
+    on the given instance, or in a worker process on the instance attached by parallel.init_worker
+    """
+    if data is None:
+        data = worker_state["data"]
+    selection = "sorted" if seed is None else "biased"
+    start_time = time.perf_counter()
+    net = savings_heur(data=data, selection=selection, seed=seed, **params)
+    return {
+        "seed": seed,
+        "cost": net.total_cost,
+        "feasible": net.check(),
+        "iterations": net.iterations,
+        "gap": net.calc_gap(),
+        "wall_time": time.perf_counter() - start_time,
+        "assignment": net.assignment.tolist(),
+    }
+
+
+def multistart(file_path="", runs:int=8, workers=None, seed:int=1, beta:float=SELECTION_BETA,
+               initial="greedy_cost", save="greedy_cost", close="greedy_cost", local_search=True,
+               include_sorted=True, data=None, time_limit=None, k_nearest=None,
+               out_of_core=False, bound=False, gap_target=None):
+    """
+    run 'runs' biased-randomized starts with seeds seed, seed+1, ...
+    (plus the deterministic sorted start if include_sorted is set)
+    time_limit: wall-clock seconds of each start (see savings_heur)
+    k_nearest: import the instance in sparse mode (see Importer)
+    out_of_core: memory-mapped cost matrices, the workers map the same files (see Importer)
+    bound: calculate a Lagrangian lower bound once and report the gap of every start (see bound.py)
+    gap_target: each start stops once its gap is below the target, and no more starts are run
+    once one of them reaches it (implies bound)
+    returns the best net and the results of the starts run (seed, cost, feasible, iterations, gap, wall_time)
+    """
+    if data is None:
+        data = Importer(file_path, k_nearest=k_nearest, out_of_core=out_of_core)
+    params = {
+        "initial": initial,
+        "save": save,
+        "close": close,
+        "local_search": local_search,
+        "beta": beta,
+        "time_limit": time_limit,
+        "gap_target": gap_target,
+    }
+    lower_bound = None
+    if bound or gap_target is not None:
+        upper_bound = initial_net(data, how=initial).calc_cost()
+        lower_bound = LagrangianBound(data).solve(upper_bound=upper_bound, gap_target=gap_target)
+    params["lower_bound"] = lower_bound
+    seeds = ([None] if include_sorted else []) + [seed + run for run in range(runs)]
+    workers = min(workers or os.cpu_count() or 1, len(seeds))
+    results = []
+    if workers > 1:
+        with SharedInstance(data) as shared:
+            with multiprocessing.Pool(workers, initializer=init_worker, initargs=(shared.spec,)) as pool:
+                # leaving the pool context stops the starts still running
+                for result in pool.imap_unordered(functools.partial(run_start, params=params), seeds):
+                    results.append(result)
+                    if gap_reached(result, gap_target):
+                        break
+    else:
+        for start_seed in seeds:
+            results.append(run_start(start_seed, params, data))
+            if gap_reached(results[-1], gap_target):
+                break
+    feasible = [result for result in results if result["feasible"]] or results
+    best = min(feasible, key=lambda result: result["cost"])
+    net = Net(f"{data.instance_type}_{data.instance}_multistart", data)
+    net.set_assignment(best["assignment"])
+    net.lower_bound = lower_bound
+    net.check()
+    net.calc_cost()
+    for result in results:
+        del result["assignment"]
+    logger.info("> multistart: best cost %s (seed %s) over %d starts", net.total_cost, best["seed"], len(results))
+    return net, results
+
+
+def gap_reached(result, gap_target) -> bool:
+    """
+    check if a feasible start reached the gap target
+    """
+    return gap_target is not None and result["feasible"] and result["gap"] is not None and result["gap"] <= gap_target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run seeded biased-randomized savings heuristic starts in parallel")
+    parser.add_argument("path", help="instance file")
+    parser.add_argument("--runs", type=int, default=8, help="number of biased-randomized starts")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the first start")
+    parser.add_argument("--beta", type=float, default=SELECTION_BETA, help="probability of picking the best saving")
+    parser.add_argument("--initial", default="greedy_cost")
+    parser.add_argument("--save", default="greedy_cost")
+    parser.add_argument("--close", default="greedy_cost")
+    parser.add_argument("--no-local-search", action="store_true")
+    parser.add_argument("--no-sorted", action="store_true", help="do not include the deterministic start")
+    parser.add_argument("--time-limit", type=float, default=None, help="wall-clock seconds of each start")
+    parser.add_argument("--k-nearest", type=int, default=None, help="candidate facilities per client (sparse mode)")
+    parser.add_argument("--out-of-core", action="store_true", help="memory-mapped float32 cost matrices")
+    parser.add_argument("--bound", action="store_true", help="calculate a lower bound and report gaps")
+    parser.add_argument("--gap-target", type=float, default=None, help="stop once a start reaches this relative gap")
+    args = parser.parse_args(argv)
+    net, results = multistart(
+        args.path,
+        runs=args.runs,
+        workers=args.workers,
+        seed=args.seed,
+        beta=args.beta,
+        initial=args.initial,
+        save=args.save,
+        close=args.close,
+        local_search=not args.no_local_search,
+        include_sorted=not args.no_sorted,
+        time_limit=args.time_limit,
+        k_nearest=args.k_nearest,
+        out_of_core=args.out_of_core,
+        bound=args.bound,
+        gap_target=args.gap_target)
+    for result in sorted(results, key=lambda result: result["cost"]):
+        gap = "" if result["gap"] is None else f" gap={100*result['gap']:.2f}%"
+        print(f"seed={result['seed']} cost={result['cost']} feasible={result['feasible']} "
+              f"iterations={result['iterations']}{gap} time={result['wall_time']:.2f}s")
+    print(net)
+    if net.lower_bound is not None:
+        print(f"lower bound: {net.lower_bound}, gap: {100*net.calc_gap():.2f}%")
+
+
+if __name__ == "__main__":
+    main()
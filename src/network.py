@@ -3,47 +3,89 @@
 """
 
 from importer import Importer
-from pyvis.network import Network
-import copy
+from instrument import logger, stats, enable_logging
+import functools
+import heapq
+import json
+import logging
+import os
 import textwrap
 import inspect
+import time
+import xml.etree.ElementTree as ElementTree
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
+UNASSIGNED = -1
+# format of the solution files (see Net.save_solution)
+SOLUTION_VERSION = 1
+# moves recorded in the action undo log
+CONNECT = 0
+DISCONNECT = 1
 
 def action_decorator(action):
+    """
+    Instrumentation hook of the actions: counts the calls (and infeasible results)
+    and times them in the run stats (see instrument.py)
+    """
     action_name = action.__name__
     # action_param = action.__code__.co_varnames[:action.__code__.co_argcount]
     # action_signature_args = inspect.getfullargspec(action).args
     # action_signature_args = inspect.signature(action)
+    @functools.wraps(action)
     def inner(*args, **kwargs):
-        if "verbose" in kwargs:
-            if kwargs["verbose"] == True:
-                print(f"> action: {action_name}", end="; ")
-                print(f"-> {args[1:]}")
-                return action(*args, **kwargs)
-            else:
-                return action(*args, **kwargs)
-        else:
-            return action(*args, **kwargs)
+        if kwargs.get("verbose") == True:
+            print(f"> action: {action_name}", end="; ")
+            print(f"-> {args[1:]}")
+        start_time = time.perf_counter()
+        result = action(*args, **kwargs)
+        stats.add_time(action_name, time.perf_counter() - start_time)
+        stats.count(action_name)
+        if not result.feasible:
+            stats.count(f"{action_name}.infeasible")
+        return result
     return inner
 
 class Net:
     """
     Class for handling nets
+    The solution is stored as arrays indexed by client/facility position:
+        - assignment: facility index of each client (UNASSIGNED if not assigned)
+        - load: aggregated demand of each facility
+        - client_count: number of clients assigned to each facility
+        - is_open: facilities with at least one assigned client
+        - fac_clients: set of client indices assigned to each facility
+    and running totals updated in O(1) on every connect/disconnect:
+        - fixed_cost, variable_cost
+        - unassigned_count: number of unassigned clients
+        - overloaded_count: number of facilities with exceeded capacity
     """
     def __init__(self, id, data:Importer):
         self.id = id
         self.data = data
-        self.opened_facilities = []
-        self.assigned_clients = []
-        self.connection_matrix = self.data.cost_matrix.astype(int)
+        number_clients = len(self.data.clients)
+        number_facilities = len(self.data.facilities)
+        self.assignment = np.full(number_clients, UNASSIGNED, dtype=np.int64)
+        self.load = np.zeros(number_facilities)
+        self.client_count = np.zeros(number_facilities, dtype=np.int64)
+        self.is_open = np.zeros(number_facilities, dtype=bool)
+        self.fac_clients = [set() for _ in range(number_facilities)]
+        self.fixed_cost:float = 0.0
+        self.variable_cost:float = 0.0
+        self.unassigned_count:int = number_clients
+        self.overloaded_count:int = 0
         self.total_cost:float = 0.0
         self.updated = True
         self.complete = False
         self.valid = False
         self.capacity = False
+        # number of facility closures performed by the savings heuristic
+        self.iterations:int = 0
+        # why the savings heuristic loop ended (see savings_loop)
+        self.stop_reason:str = ""
+        # lower bound of the instance cost, if known (see bound.py)
+        self.lower_bound = None
 
         self.initilize()
       
@@ -57,22 +99,131 @@ class Net:
         """
         return textwrap.dedent(net_summary)
 
+    @property
+    def connection_matrix(self) -> pd.DataFrame:
+        """
+        client-facility connection matrix (1: client assigned to facility)
+        built from the assignment vector, for display only
+        """
+        number_clients, number_facilities = self.data.costs.shape
+        connections = np.zeros((number_clients, number_facilities), dtype=int)
+        assigned = np.flatnonzero(self.assignment != UNASSIGNED)
+        connections[assigned, self.assignment[assigned]] = 1
+        return pd.DataFrame(
+            connections,
+            index=list(range(1, number_clients + 1)),
+            columns=list(range(1, number_facilities + 1)))
+
     def initilize(self):
         """
         All facilities are opened
         No customer is assigned to facilities
         """
-        self.connection_matrix[:] = 0
+        self.assignment[:] = UNASSIGNED
+        self.load[:] = 0.0
+        self.client_count[:] = 0
+        self.is_open[:] = False
+        for clients in self.fac_clients:
+            clients.clear()
+        self.fixed_cost = 0.0
+        self.variable_cost = 0.0
+        self.unassigned_count = len(self.assignment)
+        self.overloaded_count = 0
         self.update_net(verbose=False)
-        # self.opened_facilities = data.facilities
-        # self.assigned_clients = []
+
+    def connect(self, cli_idx:int, fac_idx:int):
+        """
+        assign client to facility (by position), the client must be unassigned
+        """
+        if self.assignment[cli_idx] != UNASSIGNED:
+            raise ValueError(f"{self.data.clients[cli_idx]} is already assigned")
+        was_overloaded = self.load[fac_idx] > self.data.capacity[fac_idx]
+        self.assignment[cli_idx] = fac_idx
+        self.load[fac_idx] += self.data.demand[cli_idx]
+        self.client_count[fac_idx] += 1
+        if not self.is_open[fac_idx]:
+            self.is_open[fac_idx] = True
+            self.fixed_cost += self.data.cost_open[fac_idx]
+        self.fac_clients[fac_idx].add(cli_idx)
+        # costs may be float32 (out-of-core mode): totals are kept in float64
+        self.variable_cost += float(self.data.costs[cli_idx, fac_idx])
+        self.unassigned_count -= 1
+        if not was_overloaded and self.load[fac_idx] > self.data.capacity[fac_idx]:
+            self.overloaded_count += 1
+        self.updated = False
+
+    def disconnect(self, cli_idx:int) -> int:
+        """
+        unassign client (by position) from its facility
+        returns the facility index the client was assigned to
+        """
+        fac_idx = int(self.assignment[cli_idx])
+        if fac_idx == UNASSIGNED:
+            raise ValueError(f"{self.data.clients[cli_idx]} is not assigned")
+        was_overloaded = self.load[fac_idx] > self.data.capacity[fac_idx]
+        self.assignment[cli_idx] = UNASSIGNED
+        self.client_count[fac_idx] -= 1
+        self.fac_clients[fac_idx].discard(cli_idx)
+        if self.client_count[fac_idx] == 0:
+            # avoid accumulating rounding errors on empty facilities
+            self.load[fac_idx] = 0.0
+            self.is_open[fac_idx] = False
+            self.fixed_cost -= self.data.cost_open[fac_idx]
+        else:
+            self.load[fac_idx] -= self.data.demand[cli_idx]
+        self.variable_cost -= float(self.data.costs[cli_idx, fac_idx])
+        self.unassigned_count += 1
+        if was_overloaded and not self.load[fac_idx] > self.data.capacity[fac_idx]:
+            self.overloaded_count -= 1
+        self.updated = False
+        return fac_idx
+
+    def set_assignment(self, assignment):
+        """
+        load a client->facility assignment vector (facility positions, UNASSIGNED if not assigned)
+        """
+        number_facilities = len(self.data.facilities)
+        self.assignment = np.array(assignment, dtype=np.int64)
+        assigned = np.flatnonzero(self.assignment != UNASSIGNED)
+        fac_indices = self.assignment[assigned]
+        self.load = np.bincount(fac_indices, weights=self.data.demand[assigned], minlength=number_facilities)
+        self.client_count = np.bincount(fac_indices, minlength=number_facilities).astype(np.int64)
+        self.is_open = self.client_count > 0
+        self.fac_clients = [set() for _ in range(number_facilities)]
+        for cli_idx, fac_idx in zip(assigned.tolist(), fac_indices.tolist()):
+            self.fac_clients[fac_idx].add(cli_idx)
+        self.refresh_totals()
+
+    @property
+    def opened_facilities(self) -> list:
+        """
+        open facilities, computed on demand
+        """
+        return self.get_open_facilities()
+
+    @property
+    def assigned_clients(self) -> list:
+        """
+        assigned clients, computed on demand
+        """
+        return self.get_assigned_clients()
+
+    def refresh_totals(self):
+        """
+        Recompute the running totals from the assignment arrays
+        (removes rounding errors accumulated by incremental updates)
+        """
+        cli_indices = np.flatnonzero(self.assignment != UNASSIGNED)
+        self.fixed_cost = float(self.data.cost_open[self.is_open].sum())
+        self.variable_cost = float(self.data.costs[cli_indices, self.assignment[cli_indices]].sum(dtype=np.float64))
+        self.unassigned_count = len(self.assignment) - cli_indices.size
+        self.overloaded_count = int(np.count_nonzero(self.load > self.data.capacity))
+        self.updated = False
 
     def update_net(self, check=True, verbose=False):
         """
-        Update opened facilities and assigned clients from connection matrix
+        Update net status flags from the running totals
         """
-        self.assigned_clients = self.get_assigned_clients()
-        self.opened_facilities = self.get_open_facilities()
         if verbose:
             print("> net updated")
             print(f"facilities: {self.opened_facilities}")
@@ -90,41 +241,35 @@ class Net:
             fixed_cost = Sum(opened_facilities)
             variable_cost = Sum(assigned_clients)
         """
-        # check net first
-        # if not self.is_valid():
-        #     self.total_cost = 0.0
-        #     print("invalid net -> cost initialized to 0.0")
-        #     return
-        # update net
         if not self.updated:
             self.update_net(verbose)
-        # initialize costs
-        fixed_cost:float = 0.0
-        variable_cost:float = 0.0
-        self.total_cost = 0.0
-        # fixed cost
-        for facility in self.opened_facilities:
-            fixed_cost += facility.cost_open
-        # variable cost
-        for client in self.assigned_clients:
-            # get facility index
-            fac_idx = self.connection_matrix.loc[client.id].idxmax()
-            # get client-facility cost
-            variable_cost += self.data.cost_matrix.loc[client.id, fac_idx]
-        # total cost
-        self.total_cost = fixed_cost + variable_cost
+        # total cost from running fixed and variable costs
+        self.total_cost = float(self.fixed_cost + self.variable_cost)
         if verbose:
             print(f"total cost of net = {self.total_cost}")
         return self.total_cost
 
+    def calc_gap(self):
+        """
+        relative gap between the net cost and the lower bound: (cost - lower bound) / cost
+        returns None if the lower bound is not known
+        """
+        if self.lower_bound is None:
+            return None
+        cost = self.calc_cost()
+        if cost <= 0:
+            return 0.0
+        return max(cost - self.lower_bound, 0.0) / cost
+
     def is_complete(self, verbose=False) -> bool:
         """
         check if net is complete: there are not unassigned clients
         """
-        if set(self.assigned_clients) != set(self.data.clients):
+        if self.unassigned_count:
             if verbose:
+                unassigned = np.flatnonzero(self.assignment == UNASSIGNED)
                 print("Incomplete net: there are unassigned clients")
-            # TODO: find unassigned clients
+                print(f"unassigned clients: {[self.data.clients[idx] for idx in unassigned]}")
             self.complete = False
             return False
         if verbose:
@@ -135,12 +280,12 @@ class Net:
     def is_valid(self, verbose=False) -> bool:
         """
         Check if the net is valid: each client is assigned to only one facility
+        the assignment vector holds one facility per client,
+        so this checks that the running counters agree with it
         """
-        if self.connection_matrix.values.sum() > len(self.data.clients):
+        if not 0 <= self.unassigned_count <= len(self.assignment):
             if verbose:
-                print("Invalid net: clients assigned more than once to a facility")
-            # TODO: find multi-assigned clients
-            # print(self.connection_matrix)
+                print("Invalid net: client counters do not match client assignments")
             self.valid = False
             return False
         if verbose:
@@ -152,15 +297,12 @@ class Net:
         """
         Check if capacity from facilities is not exceeded
         """
-        for facility in self.opened_facilities:
-            # calculate aggregated demand
-            agg_demand = self.calc_agg_demand_facility(facility)
-            # compare with facility capacity
-            if facility.capacity < agg_demand:
-                if verbose:
-                    print(f"{facility} capacity is exceeded")
-                self.capacity = False
-                return False
+        if self.overloaded_count:
+            if verbose:
+                exceeded = np.flatnonzero(self.data.capacity < self.load)
+                print(f"{self.data.facilities[exceeded[0]]} capacity is exceeded")
+            self.capacity = False
+            return False
         if verbose:
             print("Capacity not exceeded")
         self.capacity = True
@@ -177,68 +319,48 @@ class Net:
 
     def get_assigned_clients(self) -> list:
         """
-        get assigned clients from connection matrix
+        get assigned clients from the assignment vector
         """
-        list_assigned_cli = []
-        list_assigned_cli_id = self.connection_matrix[self.connection_matrix.eq(1).any(axis=1)].index.tolist()
-        for id in list_assigned_cli_id:
-            list_assigned_cli.append(self.data.cli_dict[id])
-        return list_assigned_cli
+        return [self.data.clients[idx] for idx in np.flatnonzero(self.assignment != UNASSIGNED)]
 
     def get_open_facilities(self) -> list:
         """
-        get assigned facilites from connection matrix
+        get facilities with assigned clients
         """
-        list_assigned_fac = []
-        bool_mask = (self.connection_matrix != 0).any(axis=0)
-        # list_assigned_fac_id = self.connection_matrix.index[(self.connection_matrix != 0).any(axis=0)].tolist()
-        list_assigned_fac_id = bool_mask.index[bool_mask].tolist()
-        for id in list_assigned_fac_id:
-            list_assigned_fac.append(self.data.fac_dict[id])
-        return list_assigned_fac
+        return [self.data.facilities[idx] for idx in np.flatnonzero(self.is_open)]
 
     def get_assigned_cli_to_fac(self, facility) -> list:
         """
-        get assigned clients to a given facility from connection matrix
+        get assigned clients to a given facility (sorted by client position)
         """
-        list_assigned_cli = []
-        list_assigned_cli_id = self.connection_matrix.index[self.connection_matrix[facility.id] == 1].tolist()
-        for id in list_assigned_cli_id:
-            list_assigned_cli.append(self.data.cli_dict[id])
-        return list_assigned_cli
+        return [self.data.clients[idx] for idx in sorted(self.fac_clients[facility.index])]
 
     def get_fac_from_cli(self, client):
         """
-        TODO: get corresponding facility from client
+        get corresponding facility from client (None if the client is not assigned)
         """
-        return
+        fac_idx = self.assignment[client.index]
+        if fac_idx == UNASSIGNED:
+            return None
+        return self.data.facilities[fac_idx]
 
     def calc_agg_demand_facility(self, facility) -> float:
         """
         calculate the aggregated demand of all clients assigned to a given facility
         """
-        # find assigned clients to facility
-        assigned_cli = self.connection_matrix[self.connection_matrix[facility.id] == 1].index.tolist()
-        # calculate agregated demand
-        agg_demand:float = 0.0
-        for cli_id in assigned_cli:
-            agg_demand += self.data.cli_dict[cli_id].demand
-        
-        return agg_demand
+        return float(self.load[facility.index])
 
     def find_fac_greedy_on_cost(self,client,facility_list=[]):
         """
         find a facility for a given client based on minimum cost
         only facilities in facility_list can be used
         """
-        # filter cost_matrix
-        if facility_list:
-            fac_list_ids = [facility.id for facility in facility_list]
-            filtered_cost_matrix = self.data.cost_matrix[fac_list_ids]
-        else:
-            filtered_cost_matrix = self.data.cost_matrix
-        fac_namex = filtered_cost_matrix.loc[client.id].idxmin()
-        facility = self.data.fac_dict[fac_namex]
+        # if facility list is empty use all facilities
+        if not facility_list:
+            facility_list = self.data.facilities
+        fac_indices = [facility.index for facility in facility_list]
+        client_costs = self.data.costs[client.index, fac_indices]
+        facility = facility_list[int(np.argmin(client_costs))]
         return facility
 
     def find_fac_greedy_on_marginal_cost(self,client,facility_list=[]):
@@ -246,70 +368,255 @@ class Net:
         find a facility for a given client based on minimum marginal cost
         only facilities in facility_list can be used
         marginal cost: difference between assignment cost of a client to 2 facilities
+        the facility where the client has the best position in the preference list is selected,
+        using the rank matrix precomputed by the importer
         """
         # if facility list is empty use all facilities
         if not facility_list:
             facility_list = self.data.facilities
-        prefs = self.get_fac_prefs()
-        client_position_dict = {}
-        for facility in facility_list:
-            # create a dictionary with the preference position by facility
-            client_position_dict[facility.id] = prefs[facility.id].index(client.id)
-        fac_idx = min(client_position_dict, key=client_position_dict.get)
-        facility = self.data.fac_dict[fac_idx]
+        fac_indices = [facility.index for facility in facility_list]
+        client_positions = self.data.rank_matrix[client.index, fac_indices]
+        facility = facility_list[int(np.argmin(client_positions))]
         return facility
     
+    def find_fac_idx(self, cli_idx:int, allowed, how="greedy_cost") -> int:
+        """
+        find a facility (by position) for a given client (by position)
+        only facilities in the boolean mask 'allowed' can be used
+        returns UNASSIGNED if there is no allowed facility
+            - "greedy_cost": minimum cost
+            - "greedy_marginal": best position in the facility preference lists
+        in sparse mode only the client candidate list is searched,
+        unless none of the candidates is allowed (full facility list)
+        """
+        candidates = self.data.get_candidates(cli_idx)
+        if candidates is not None:
+            candidates = candidates[allowed[candidates]]
+            if candidates.size:
+                if how == "greedy_cost":
+                    # candidates are sorted by cost
+                    return int(candidates[0])
+                elif how == "greedy_marginal":
+                    return int(candidates[np.argmin(self.data.rank_matrix[cli_idx, candidates])])
+                else:
+                    raise ValueError(f"unknown strategy: {how}")
+            stats.count("candidates_fallback")
+        if not allowed.any():
+            return UNASSIGNED
+        if how == "greedy_cost":
+            scores = np.where(allowed, self.data.costs[cli_idx], np.inf)
+        elif how == "greedy_marginal":
+            scores = np.where(allowed, self.data.rank_matrix[cli_idx], np.iinfo(np.int32).max)
+        else:
+            raise ValueError(f"unknown strategy: {how}")
+        return int(np.argmin(scores))
+
     def get_fac_prefs(self) -> dict:
         """
         get facility preferences from marginal cost matrix
         """
         prefs_dict = {}
+        order = np.argsort(self.data.rank_matrix, axis=0)
         for facility in self.data.facilities:
-            marg_prefs = self.data.marginal_cost_matrix[facility.id]
-            marg_prefs_sorted = marg_prefs.sort_values(ascending=False)
-            prefs_dict[facility.id] = marg_prefs_sorted.index.to_list()
+            prefs_dict[facility.id] = [self.data.clients[idx].id for idx in order[:, facility.index]]
         return prefs_dict
 
-    def draw_net(self):
+    def save_solution(self, path:str, **params) -> str:
+        """
+        save the solution as JSON: assignment vector (facility positions), instance hash,
+        cost, run information and the given parameters (see load_solution)
+        the file is replaced atomically, so it can be used as a checkpoint
+        returns the path of the saved file
+        """
+        solution = {
+            "version": SOLUTION_VERSION,
+            "instance_type": self.data.instance_type,
+            "instance": self.data.instance,
+            "path": self.data.import_file_path,
+            "instance_hash": self.data.instance_hash(),
+            "net": str(self.id),
+            "cost": self.calc_cost(),
+            "feasible": self.check(),
+            "iterations": self.iterations,
+            "stop_reason": self.stop_reason,
+            "lower_bound": self.lower_bound,
+            "params": params,
+            "assignment": self.assignment.tolist(),
+        }
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(solution, file)
+        os.replace(temp_path, path)
+        logger.info("> solution saved: %s", path)
+        return path
+
+    def graph_data(self, aggregated=False) -> dict:
+        """
+        solution graph as plain data {"nodes": [...], "edges": [...]}
+        only the assigned client-facility edges are listed
+            - aggregated=False: one node per facility ("f<id>") and client ("c<id>"),
+              one edge per assigned client with its cost
+            - aggregated=True: one node per open facility with its clients count and load, no edges
+        """
+        data = self.data
+        open_facilities = np.flatnonzero(self.is_open)
+        nodes = []
+        for fac_idx in (open_facilities if aggregated else range(len(data.facilities))):
+            nodes.append({
+                "id": f"f{data.facilities[fac_idx].id}",
+                "kind": "facility",
+                "open": bool(self.is_open[fac_idx]),
+                "clients": int(self.client_count[fac_idx]),
+                "load": float(self.load[fac_idx]),
+                "capacity": float(data.capacity[fac_idx]),
+                "cost_open": float(data.cost_open[fac_idx]),
+            })
+        edges = []
+        if not aggregated:
+            for client in data.clients:
+                nodes.append({"id": f"c{client.id}", "kind": "client", "demand": float(data.demand[client.index])})
+            assigned = np.flatnonzero(self.assignment != UNASSIGNED)
+            fac_indices = self.assignment[assigned]
+            costs = np.asarray(data.costs[assigned, fac_indices], dtype=np.float64)
+            for cli_idx, fac_idx, cost in zip(assigned.tolist(), fac_indices.tolist(), costs.tolist()):
+                edges.append({
+                    "source": f"f{data.facilities[fac_idx].id}",
+                    "target": f"c{data.clients[cli_idx].id}",
+                    "cost": cost,
+                })
+        return {"nodes": nodes, "edges": edges}
+
+    def export_graph(self, path:str, aggregated=False) -> str:
+        """
+        save the solution graph (see graph_data) as JSON or GraphML (by file extension)
+        returns the path of the saved file
+        """
+        graph = self.graph_data(aggregated)
+        if path.endswith(".graphml"):
+            write_graphml(graph, path)
+        elif path.endswith(".json"):
+            with open(path, "w") as file:
+                json.dump({"net": str(self.id), **graph}, file)
+        else:
+            raise ValueError(f"unknown graph format: {path} (use .json or .graphml)")
+        logger.info("> graph saved: %s", path)
+        return path
+
+    def draw_net(self, aggregated=False, path=None):
         """
-        Create graph of net
+        Create graph of net (HTML page, requires pyvis)
+        only the assigned client-facility edges are drawn,
+        with aggregated=True one node per open facility is drawn, sized by its clients count
+        returns the path of the saved page
         """
+        from pyvis.network import Network
         net_graph = Network()
-        net_melt = self.data.cost_matrix.melt(ignore_index=False).reset_index()
-        net_melt["variable"] = "f"+ net_melt["variable"].astype(str)
-        net_melt["index"] = "c"+ net_melt["index"].astype(str)
-        for facility in self.data.facilities:
-            net_graph.add_node("f"+str(facility.id), title=str(facility.id), color="red")
-        for client in self.data.clients:
-            net_graph.add_node("c"+str(client.id), title=str(client.id), color="blue")
-        for _, row in net_melt.iterrows():
-            fac_name = row["variable"]
-            cli_name = row["index"]
-            fac_id = int(fac_name.replace("f",""))
-            cli_id = int(cli_name.replace("c",""))
-            cost = row["value"]
-            if self.connection_matrix.loc[cli_id, fac_id] == 1:
-                net_graph.add_edge(
-                    fac_name,
-                    cli_name,
-                    lenght = cost,
-                    color = "black",
-                    label = str(cost))
+        graph = self.graph_data(aggregated)
+        for node in graph["nodes"]:
+            if node["kind"] == "client":
+                net_graph.add_node(node["id"], title=node["id"][1:], color="blue")
+            elif aggregated:
+                net_graph.add_node(
+                    node["id"],
+                    title=f"{node['id'][1:]}: {node['clients']} clients, load {node['load']:g}/{node['capacity']:g}",
+                    value=node["clients"],
+                    color="red")
+            else:
+                net_graph.add_node(node["id"], title=node["id"][1:], color="red")
+        for edge in graph["edges"]:
+            net_graph.add_edge(
+                edge["source"],
+                edge["target"],
+                lenght = edge["cost"],
+                color = "black",
+                label = str(edge["cost"]))
         net_graph.show_buttons(filter_=['physics'])
-        net_graph.toggle_physics(True)
-        net_graph.show(f"out/net_{self.id}.html")
+        net_graph.toggle_physics(not aggregated)
+        path = path or f"out/net_{self.id}.html"
+        net_graph.write_html(path)
+        return path
+
+
+def read_solution(path:str) -> dict:
+    """
+    read a solution file (see Net.save_solution)
+    """
+    with open(path) as file:
+        solution = json.load(file)
+    if solution.get("version") != SOLUTION_VERSION:
+        raise ValueError(f"unsupported solution file: {path}")
+    return solution
+
+
+def load_solution(path:str, data=None, name=None) -> Net:
+    """
+    load a solution file (see Net.save_solution) as a net
+    without data the instance is imported from the path stored in the solution
+    raises ValueError if the solution does not belong to the instance
+    """
+    solution = read_solution(path)
+    if data is None:
+        data = Importer(solution["path"])
+    if solution["instance_hash"] != data.instance_hash() or len(solution["assignment"]) != len(data.clients):
+        raise ValueError(f"{path} is not a solution of {data.instance_type}/{data.instance}")
+    net = Net(solution["net"] if name is None else name, data)
+    net.set_assignment(solution["assignment"])
+    net.iterations = solution["iterations"]
+    net.stop_reason = solution["stop_reason"]
+    net.lower_bound = solution["lower_bound"]
+    net.check()
+    net.calc_cost()
+    return net
+
+
+def write_graphml(graph:dict, path:str):
+    """
+    save a graph (see Net.graph_data) as GraphML, node and edge fields become attributes
+    """
+    root = ElementTree.Element("graphml", xmlns="http://graphml.graphdrawing.org/xmlns")
+    types = {bool: "boolean", int: "int", float: "double", str: "string"}
+    keys = {}
+    for domain, items in (("node", graph["nodes"]), ("edge", graph["edges"])):
+        for item in items:
+            for name, value in item.items():
+                if name in ("id", "source", "target") or (domain, name) in keys:
+                    continue
+                keys[(domain, name)] = f"{domain[0]}_{name}"
+                ElementTree.SubElement(
+                    root, "key", {"id": keys[(domain, name)], "for": domain,
+                                  "attr.name": name, "attr.type": types[type(value)]})
+    graph_element = ElementTree.SubElement(root, "graph", id="net", edgedefault="undirected")
+    for domain, items in (("node", graph["nodes"]), ("edge", graph["edges"])):
+        for item in items:
+            if domain == "node":
+                element = ElementTree.SubElement(graph_element, "node", id=item["id"])
+            else:
+                element = ElementTree.SubElement(graph_element, "edge", source=item["source"], target=item["target"])
+            for name, value in item.items():
+                if (domain, name) in keys:
+                    text = str(value).lower() if isinstance(value, bool) else str(value)
+                    ElementTree.SubElement(element, "data", key=keys[(domain, name)]).text = text
+    ElementTree.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
 
 
 class Action:
     """
     Class for handling actions on nets
-    TODO: deepcopy net and assing new id?
+    Moves are applied in place on the given net (the instance data is never copied)
+    and recorded in an undo log, so infeasible or evaluation-only actions can be rolled back
     """
     def __init__(self, net):
         self.net = net
-        self.old_net = copy.deepcopy(net)
-        self.new_net = copy.deepcopy(net)
-        # if not provided, assign action id based on timestamp
+        self.new_net = net
+        self.cost_ini:float = net.calc_cost()
+        self.log = []
+        # facilities examined by composed actions (see close_facility)
+        self.touched = set()
+        # spare capacity the result relies on in facilities that did not receive clients (see relocate_by_regret)
+        self.margins = {}
 
         self.done = False
         self.feasible:bool = True
@@ -325,38 +632,90 @@ class Action:
 
     def calculate_balance(self):
         """
-        TODO: Calculate action balance
+        Calculate action balance: cost after the action minus cost before it
         """
-        cost_ini = self.old_net.total_cost
-        cost_end = self.new_net.calc_cost(verbose=False)
-        balance = cost_end - cost_ini
+        cost_end = self.net.calc_cost(verbose=False)
+        balance = cost_end - self.cost_ini
         return balance
 
+    def connect(self, cli_idx:int, fac_idx:int):
+        """
+        assign client to facility (by position) and record the move
+        """
+        self.net.connect(cli_idx, fac_idx)
+        self.log.append((CONNECT, cli_idx, fac_idx))
+
+    def disconnect(self, cli_idx:int):
+        """
+        unassign client (by position) and record the move
+        """
+        fac_idx = self.net.disconnect(cli_idx)
+        self.log.append((DISCONNECT, cli_idx, fac_idx))
+
+    def changed_facilities(self) -> set:
+        """
+        facilities (by position) whose clients were changed by the recorded moves
+        """
+        return {fac_idx for _, _, fac_idx in self.log}
+
+    def headroom(self) -> dict:
+        """
+        spare capacity left in the facilities (by position) that received clients
+        (and the margins of the facilities the result relies on, see relocate_by_regret)
+        """
+        headroom = {
+            fac_idx: self.net.data.capacity[fac_idx] - self.net.load[fac_idx]
+            for move, _, fac_idx in self.log
+            if move == CONNECT}
+        for fac_idx, margin in self.margins.items():
+            headroom[fac_idx] = min(headroom.get(fac_idx, margin), margin)
+        return headroom
+
+    def undo(self, savepoint:int=0):
+        """
+        Roll back the moves recorded after the savepoint (all moves by default)
+        """
+        if len(self.log) > savepoint:
+            stats.count("moves_undone", len(self.log) - savepoint)
+        while len(self.log) > savepoint:
+            move, cli_idx, fac_idx = self.log.pop()
+            if move == CONNECT:
+                self.net.disconnect(cli_idx)
+            else:
+                self.net.connect(cli_idx, fac_idx)
+        self.done = bool(self.log)
+        return self
+
     @action_decorator
     def assign_cli_to_fac(self,client,facility,verbose=False):
         """
         assign client to facility
         """
-        self.new_net.updated = False
         # check if already assigned
-        if self.old_net.connection_matrix.loc[client.id, facility.id] == 1:
+        assigned_fac = self.net.assignment[client.index]
+        if assigned_fac == facility.index:
             if verbose:
                 print(f"{client} already assigned to {facility}")
             self.feasible = False
             return self
+        # a client can only be assigned to one facility
+        if assigned_fac != UNASSIGNED:
+            if verbose:
+                print(f"Invalid action: {client} is assigned to {self.net.data.facilities[assigned_fac]}")
+            self.feasible = False
+            return self
         # assign client to facility
-        self.new_net.connection_matrix.loc[client.id, facility.id] = 1
-        # update net
-        # self.new_net.update_net(verbose=False)
+        self.connect(client.index, facility.index)
         # check feasibility
-        if not self.new_net.is_valid() or not self.new_net.is_capacity_ok():
+        if not self.net.is_capacity_ok():
             if verbose:
                 print(f"Unfeasible action: {client} cannot be assigned to {facility}")
             self.feasible = False
-            self.new_net = self.net
+            self.undo()
             return self
         # calculate balance
         self.balance = self.calculate_balance()
+        self.done = True
         if verbose:
             print(f"{client} assigned to {facility}")
             print(f"balance: {self.balance:+}")
@@ -367,18 +726,16 @@ class Action:
         """
         unassign client to facility
         """
-        self.new_net.updated = False
         # check if already unassigned
-        if self.old_net.connection_matrix.loc[client.id, facility.id] == 0:
-            print(f"{client} is not assigned to {facility}")
+        if self.net.assignment[client.index] != facility.index:
+            logger.debug("%s is not assigned to %s", client, facility)
             self.feasible = False
             return self
         # unassign client to facility
-        self.new_net.connection_matrix.loc[client.id, facility.id] = 0
-        # update net
-        # self.new_net.update_net(verbose=False)
+        self.disconnect(client.index)
         # calculate balance
         self.balance = self.calculate_balance()
+        self.done = True
         if verbose:
             print(f"{client} unassigned to {facility}")
             print(f"balance: {self.balance:+}")
@@ -386,63 +743,206 @@ class Action:
 
 
     @action_decorator
-    def close_facility(self,facility,how="greedy_cost",verbose=True):
+    def close_facility(self,facility,how="greedy_cost",verbose=False):
         """
         Composed action
         Close given facility and relocates clients using:
             - "greedy_cost": cost matrix in a greedy fashion
             - "greedy_marginal": marginal cost matrix in a greedy fashion
+            - "regret": cost matrix, clients with the largest regret first (see relocate_by_regret)
+        If a client cannot be relocated the action is rolled back (balance = inf)
+        Every facility examined as a candidate is recorded in 'touched':
+        the result of the action can only change if one of them changes
         """
-        print(f"----------> NEW CLOSE (test): {facility} <-----------")
-        self.new_net.updated = False
-        open_facilities = self.net.get_open_facilities()
-        clients = self.net.get_assigned_cli_to_fac(facility)
+        logger.debug("----------> NEW CLOSE (test): %s <-----------", facility)
         # check if already unassigned
-        if facility not in open_facilities:
-            print(f"{facility} is already closed")
+        if not self.net.is_open[facility.index]:
+            logger.debug("%s is already closed", facility)
             self.feasible = False
             return self
-        # open_fac_without_current = list(open_facilities)
-        # open_fac_without_current.remove(facility)
+        clients = self.net.get_assigned_cli_to_fac(facility)
+        self.touched.add(facility.index)
+        if how == "regret":
+            return self.relocate_by_regret(facility, clients, verbose)
+        open_fac_without_current = self.net.is_open.copy()
+        open_fac_without_current[facility.index] = False
+        debug = logger.isEnabledFor(logging.DEBUG)
         for client in clients:
-            # reset list of open facilities for the current client
-            open_fac_without_current = list(open_facilities)
-            open_fac_without_current.remove(facility)
+            # reset candidate facilities for the current client
+            candidates = open_fac_without_current.copy()
             # unassign client
-            act_unassign= Action(self.new_net).unassign_cli_to_fac(client,facility,verbose=True)
-            self.new_net = act_unassign.new_net
+            self.disconnect(client.index)
             # find the most convenient facility that is not closed and assign client
-            best_fac = None
-            print(f"----------> find facility loop: {open_fac_without_current}")
-            while not best_fac:
-                if how == "greedy_cost":
-                    candidate_fac = self.net.find_fac_greedy_on_cost(client,open_fac_without_current)
-                elif how == "greedy_marginal":
-                    candidate_fac = self.net.find_fac_greedy_on_marginal_cost(client,open_fac_without_current)
-                act_assign= Action(self.new_net).assign_cli_to_fac(client,candidate_fac,verbose=True)
-                if act_assign.feasible:
-                    self.new_net = act_assign.new_net
-                    best_fac = candidate_fac
-                else:
-                    print(f"---> candidate discarded: {candidate_fac}")
-                    print(f"remaining fac: {open_fac_without_current}")
-                    try:
-                        open_fac_without_current.remove(candidate_fac)
-                    except ValueError:
-                        if verbose:
-                            print(f"> {facility} cannot be closed, {client} cannot be reasigned")
-                        self.feasible = False
-                        self.balance = float("inf")
-                        return self
+            if debug:
+                logger.debug("----------> find facility loop: %s", [self.net.data.facilities[idx] for idx in np.flatnonzero(candidates)])
+            while True:
+                fac_idx = self.net.find_fac_idx(client.index, candidates, how)
+                self.touched.add(fac_idx)
+                if fac_idx == UNASSIGNED:
+                    if verbose:
+                        print(f"> {facility} cannot be closed, {client} cannot be reasigned")
+                    self.feasible = False
+                    self.balance = float("inf")
+                    self.undo()
+                    return self
+                savepoint = len(self.log)
+                self.connect(client.index, fac_idx)
+                if not self.net.overloaded_count:
+                    break
+                self.undo(savepoint)
+                stats.count("candidates_infeasible")
+                if debug:
+                    logger.debug("---> candidate discarded: %s", self.net.data.facilities[fac_idx])
+                candidates[fac_idx] = False
         # calculate balance
         self.balance = self.calculate_balance()
+        self.done = True
         if verbose:
             print(f"{facility} closed:")
             print(f" - greedy client reassignation: {clients}")
             print(f" - balance: {self.balance:+}")
         return self
 
+    def relocate_by_regret(self, facility, clients, verbose=False):
+        """
+        Close given facility relocating its clients as a small generalized assignment problem:
+        the client with the largest regret (cost difference between its best and second best
+        feasible facility) is assigned first to its best feasible facility
+            - each client scans the open facilities by increasing cost with a pointer:
+              a facility without residual capacity for the client is skipped for good
+              (residual capacities only decrease while relocating)
+            - regrets are kept in a heap; when a facility fills, the remaining clients whose best
+              or second best facility it was are re-evaluated and pushed again with their new regret
+              (a regret can go up or down), outdated heap entries are skipped when popped
+            - in sparse mode a client only scans its candidate list (a single feasible candidate
+              gives an infinite regret), and the open facilities once none of its candidates fits
+        Every capacity test decides the order, so the spare capacity each passed test relied on
+        is recorded in 'margins'
+        """
+        net = self.net
+        data = net.data
+        for client in clients:
+            self.disconnect(client.index)
+        allowed = net.is_open.copy()
+        allowed[facility.index] = False
+        fac_indices = np.flatnonzero(allowed)
+        residual = data.capacity - net.load
+        cli_indices = [client.index for client in clients]
+        # facilities of each client in cost order, and their costs
+        orders = {}
+        order_costs = {}
+        if data.knn_indices is not None:
+            for cli_idx in cli_indices:
+                candidates = data.get_candidates(cli_idx)
+                kept = allowed[candidates]
+                orders[cli_idx] = candidates[kept]
+                order_costs[cli_idx] = data.get_candidate_costs(cli_idx)[kept]
+        elif cli_indices:
+            costs = np.asarray(data.costs[np.ix_(cli_indices, fac_indices)])
+            sorted_positions = np.argsort(costs, axis=1, kind="stable")
+            orders.update(zip(cli_indices, fac_indices[sorted_positions]))
+            order_costs.update(zip(cli_indices, np.take_along_axis(costs, sorted_positions, axis=1)))
+        # clients scanning all the open facilities (sparse mode fallback)
+        full_orders = set() if data.knn_indices is not None else set(cli_indices)
+        pointers = dict.fromkeys(cli_indices, 0)
+        # facility -> clients whose best or second best facility it was when their regret was stored
+        watchers = {}
+
+        def next_feasible(cli_idx, position):
+            # first position (from the given one) of a facility with enough residual capacity
+            order = orders[cli_idx]
+            demand = data.demand[cli_idx]
+            while position < len(order):
+                fac_idx = int(order[position])
+                self.touched.add(fac_idx)
+                if residual[fac_idx] >= demand:
+                    margin = residual[fac_idx] - demand
+                    self.margins[fac_idx] = min(self.margins.get(fac_idx, margin), margin)
+                    break
+                position += 1
+            return position
+
+        def regret(cli_idx):
+            # regret of a client (None if no facility can take it), moves its pointer to the best feasible facility
+            first = next_feasible(cli_idx, pointers[cli_idx])
+            if first == len(orders[cli_idx]) and cli_idx not in full_orders:
+                # none of the candidates fits: all the open facilities
+                stats.count("candidates_fallback")
+                full_orders.add(cli_idx)
+                costs = np.asarray(data.costs[cli_idx, fac_indices])
+                sorted_positions = np.argsort(costs, kind="stable")
+                orders[cli_idx] = fac_indices[sorted_positions]
+                order_costs[cli_idx] = costs[sorted_positions]
+                first = next_feasible(cli_idx, 0)
+            order = orders[cli_idx]
+            pointers[cli_idx] = first
+            if first == len(order):
+                return None
+            watchers.setdefault(int(order[first]), set()).add(cli_idx)
+            second = next_feasible(cli_idx, first + 1)
+            if second == len(order):
+                return float("inf")
+            watchers.setdefault(int(order[second]), set()).add(cli_idx)
+            return float(order_costs[cli_idx][second]) - float(order_costs[cli_idx][first])
+
+        keys = {}
+        ranks = {}
+        heap = []
+        for rank, client in enumerate(clients):
+            value = regret(client.index)
+            if value is None:
+                return self.reject_closure(facility, client, verbose)
+            keys[client.index] = -value
+            ranks[client.index] = rank
+            heap.append((-value, rank, client.index))
+        heapq.heapify(heap)
+        while heap:
+            key, rank, cli_idx = heapq.heappop(heap)
+            if keys.get(cli_idx) != key:
+                # client already assigned or regret changed since the entry was pushed
+                continue
+            del keys[cli_idx]
+            fac_idx = int(orders[cli_idx][pointers[cli_idx]])
+            self.connect(cli_idx, fac_idx)
+            residual[fac_idx] -= data.demand[cli_idx]
+            # re-key the remaining clients that no longer fit in the facility
+            watching = watchers.get(fac_idx, set())
+            for other in list(watching):
+                if other in keys and residual[fac_idx] >= data.demand[other]:
+                    continue
+                watching.discard(other)
+                if other not in keys:
+                    continue
+                value = regret(other)
+                if value is None:
+                    return self.reject_closure(facility, data.clients[other], verbose)
+                if -value != keys[other]:
+                    keys[other] = -value
+                    heapq.heappush(heap, (-value, ranks[other], other))
+        if net.overloaded_count:
+            # rounding of the residual capacities
+            return self.reject_closure(facility, clients[0], verbose)
+        self.balance = self.calculate_balance()
+        self.done = True
+        if verbose:
+            print(f"{facility} closed:")
+            print(f" - regret client reassignation: {clients}")
+            print(f" - balance: {self.balance:+}")
+        return self
+
+    def reject_closure(self, facility, client, verbose=False):
+        """
+        roll back a closure that cannot relocate the given client
+        """
+        if verbose:
+            print(f"> {facility} cannot be closed, {client} cannot be reasigned")
+        self.feasible = False
+        self.balance = float("inf")
+        self.undo()
+        return self
+
 if __name__ == "__main__":
+    enable_logging()
     file_path = "inputs/Holmberg_Instances/p2"
     data = Importer(file_path)
     net = Net(1, data)
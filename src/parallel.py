@@ -0,0 +1,155 @@
+"""
+
+"""
+
+from importer import Importer
+from network import Net, Action
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+
+SHARED_ARRAYS = ("capacity", "cost_open", "demand", "costs", "marginal", "rank_matrix")
+# shared only if the importer has them (sparse mode)
+OPTIONAL_SHARED_ARRAYS = ("knn_indptr", "knn_indices", "knn_costs")
+# tasks per worker, to balance closures of different size
+CHUNKS_PER_WORKER = 4
+
+# state of the current worker process (see init_worker)
+worker_state = {}
+
+
+class SharedInstance:
+    """
+    Class for placing the instance arrays of an importer in shared memory
+    Worker processes attach to the memory blocks by name (see attach_instance),
+    so the arrays are copied once per run instead of being pickled per task
+    Memory-mapped arrays (out-of-core mode) are not copied: workers map the same files
+    """
+    def __init__(self, data:Importer):
+        self.blocks = []
+        self.spec = {
+            "instance_type": data.instance_type,
+            "instance": data.instance,
+            "import_file_path": data.import_file_path,
+            "source_hash": data.source_hash,
+            "arrays": {},
+            "files": {},
+        }
+        for name in SHARED_ARRAYS + OPTIONAL_SHARED_ARRAYS:
+            array = getattr(data, name)
+            if array is None:
+                continue
+            if isinstance(array, np.memmap) and array.filename:
+                self.spec["files"][name] = array.filename
+                continue
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared_array[...] = array
+            self.blocks.append(block)
+            self.spec["arrays"][name] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        release the shared memory blocks
+        """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_instance(spec):
+    """
+    Create an importer whose arrays are views on the shared memory blocks of a SharedInstance
+    Returns the importer and the attached blocks (they must be kept alive while it is used)
+    """
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec["arrays"].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        blocks.append(block)
+    for name, path in spec.get("files", {}).items():
+        arrays[name] = np.load(path, mmap_mode="r")
+    data = Importer.from_arrays(
+        arrays,
+        instance_type=spec["instance_type"],
+        instance=spec["instance"],
+        import_file_path=spec["import_file_path"],
+        source_hash=spec["source_hash"])
+    return data, blocks
+
+
+def init_worker(spec):
+    """
+    Worker initializer: attach the shared instance once per process
+    """
+    data, blocks = attach_instance(spec)
+    worker_state["data"] = data
+    worker_state["blocks"] = blocks
+    worker_state["net"] = Net("worker", data)
+
+
+def evaluate_closures(assignment, fac_indices, how):
+    """
+    Worker task: simulate the closure of the given facilities (by position) on the given assignment
+    Returns a list of (facility position, balance, touched facilities, headroom)
+    """
+    data = worker_state["data"]
+    net = worker_state["net"]
+    net.set_assignment(assignment)
+    results = []
+    for fac_idx in fac_indices:
+        act_close = Action(net).close_facility(data.facilities[fac_idx], how=how, verbose=False)
+        results.append((fac_idx, act_close.balance, act_close.touched, act_close.headroom()))
+        act_close.undo()
+    return results
+
+
+class ClosurePool:
+    """
+    Class for simulating facility closures in a pool of worker processes
+    The instance is placed in shared memory once, each task only receives the assignment vector
+    """
+    def __init__(self, data:Importer, workers:int):
+        self.workers = workers
+        self.shared = SharedInstance(data)
+        try:
+            self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(self.shared.spec,))
+        except Exception:
+            self.shared.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def evaluate(self, net:Net, fac_indices, how="greedy_cost") -> list:
+        """
+        simulate the closure of the given facilities (by position)
+        results are returned in the same order as fac_indices
+        """
+        number_chunks = min(len(fac_indices), self.workers * CHUNKS_PER_WORKER)
+        chunks = [chunk.tolist() for chunk in np.array_split(np.asarray(fac_indices), number_chunks)]
+        tasks = [(net.assignment, chunk, how) for chunk in chunks if chunk]
+        results = []
+        for chunk_results in self.pool.starmap(evaluate_closures, tasks):
+            results.extend(chunk_results)
+        return results
+
+    def close(self):
+        """
+        stop the worker processes and release the shared instance
+        """
+        self.pool.close()
+        self.pool.join()
+        self.shared.close()
@@ -0,0 +1,241 @@
+"""
+Batch runner for the savings heuristic
+Runs every instance x strategy configuration on a pool of worker processes
+and streams each result to a CSV or JSONL file as soon as it finishes.
+Jobs that already have a result in the output file are skipped (resume).
+
+usage:
+    python src/runner.py inputs/Holmberg_Instances "inputs/Yang_Instances/**/*.dat" \
+        --initial greedy_cost greedy_marginal --workers 8 --output out/results.csv
+"""
+
+from heuristic import savings_heur
+from importer import Importer
+import argparse
+import contextlib
+import csv
+import datetime
+import functools
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows: peak memory is not reported
+    resource = None
+
+STRATEGIES = ["greedy_cost", "greedy_marginal"]
+RESULT_FIELDS = [
+    "instance_type", "instance", "path", "initial", "save", "close",
+    "status", "cost", "wall_time", "iterations", "peak_memory_mb", "finished_at", "error"]
+# files created next to the instances that are not instances
+IGNORED_SUFFIXES = (".npz", ".tmp", ".json", ".csv", ".jsonl")
+
+
+def find_instances(patterns) -> list:
+    """
+    expand folders (all files, recursively) and glob patterns into a sorted list of instance paths
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and not path.endswith(IGNORED_SUFFIXES) and not is_hidden(path):
+                paths.add(os.path.normpath(path))
+    return sorted(paths)
+
+
+def is_hidden(path) -> bool:
+    """
+    check if the path is inside a hidden folder (e.g. the importer '.cache' folder)
+    """
+    folders = os.path.normpath(path).split(os.sep)[:-1]
+    return any(folder.startswith(".") and folder not in (".", "..") for folder in folders)
+
+
+def job_key(path, initial, save, close) -> tuple:
+    return (os.path.normpath(path), initial, save, close)
+
+
+def read_done_jobs(output) -> set:
+    """
+    keys of the jobs with a successful result in the output file
+    """
+    done = set()
+    if not os.path.isfile(output):
+        return done
+    with open(output, newline="") as file:
+        if output.endswith(".jsonl"):
+            rows = []
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # interrupted write
+                    continue
+        else:
+            rows = list(csv.DictReader(file))
+    for row in rows:
+        if row.get("status") == "ok":
+            done.add(job_key(row["path"], row["initial"], row["save"], row["close"]))
+    return done
+
+
+def peak_memory_mb():
+    """
+    peak resident memory of the current process in MB (None if not available)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        return peak / 2**20
+    return peak / 2**10
+
+
+def job_path(folder, job) -> str:
+    """
+    JSON file of a job (stats or solution): <folder>/<instance type>_<instance>_<initial>_<save>_<close>.json
+    """
+    path, initial, save, close = job
+    instance_type, instance = Importer.parse_instance_path(path)
+    return os.path.join(folder, f"{instance_type}_{instance}_{initial}_{save}_{close}.json")
+
+
+def run_job(job, stats_dir=None, solutions_dir=None) -> dict:
+    """
+    run the savings heuristic for one instance and strategy configuration
+    with stats_dir the timers and counters of the run are saved there (see job_path)
+    with solutions_dir the solution of the run is saved there (see Net.save_solution)
+    """
+    path, initial, save, close = job
+    instance_type, instance = Importer.parse_instance_path(path)
+    result = {
+        "instance_type": instance_type,
+        "instance": instance,
+        "path": path,
+        "initial": initial,
+        "save": save,
+        "close": close,
+    }
+    start_time = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            net = savings_heur(
+                path, initial=initial, save=save, close=close,
+                stats_file=job_path(stats_dir, job) if stats_dir else None,
+                solution_file=job_path(solutions_dir, job) if solutions_dir else None)
+        result.update({
+            "status": "ok",
+            "cost": net.total_cost,
+            "iterations": net.iterations,
+            "error": "",
+        })
+    except Exception:
+        result.update({"status": "error", "cost": None, "iterations": None, "error": traceback.format_exc(limit=3)})
+    result["wall_time"] = time.perf_counter() - start_time
+    result["peak_memory_mb"] = peak_memory_mb()
+    result["finished_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    return result
+
+
+class ResultWriter:
+    """
+    Class for appending results to a CSV or JSONL file (one flushed row per result)
+    """
+    def __init__(self, output):
+        self.output = output
+        self.jsonl = output.endswith(".jsonl")
+        folder = os.path.dirname(output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        write_header = not os.path.isfile(output) or os.path.getsize(output) == 0
+        self.file = open(output, "a", newline="")
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            if write_header:
+                self.writer.writeheader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def write(self, result):
+        if self.jsonl:
+            self.file.write(json.dumps(result) + "\n")
+        else:
+            self.writer.writerow(result)
+        self.file.flush()
+
+
+def run_batch(patterns, initial=None, save=None, close=None, output="out/results.csv", workers=None, resume=True, stats_dir=None, solutions_dir=None) -> list:
+    """
+    run all instance x (initial, save, close) configurations on a pool of worker processes
+    each worker process runs one job (so peak memory is measured per job)
+    with stats_dir the timers and counters of each job are saved as JSON files in that folder
+    with solutions_dir the solution of each job is saved as JSON files in that folder
+    returns the results of the jobs run
+    """
+    instances = find_instances(patterns)
+    configs = list(itertools.product(initial or STRATEGIES, save or STRATEGIES, close or STRATEGIES))
+    jobs = [(path, *config) for path in instances for config in configs]
+    done = read_done_jobs(output) if resume else set()
+    pending = [job for job in jobs if job_key(*job) not in done]
+    print(f"{len(instances)} instances, {len(configs)} configurations: {len(jobs)} jobs")
+    print(f"{len(jobs) - len(pending)} jobs already done, {len(pending)} to run")
+    results = []
+    if not pending:
+        return results
+    workers = workers or os.cpu_count() or 1
+    with ResultWriter(output) as writer, multiprocessing.Pool(min(workers, len(pending)), maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(functools.partial(run_job, stats_dir=stats_dir, solutions_dir=solutions_dir), pending):
+            writer.write(result)
+            results.append(result)
+            print(f"[{len(results)}/{len(pending)}] {result['path']} "
+                  f"{result['initial']}/{result['save']}/{result['close']}: "
+                  f"{result['status']} cost={result['cost']} time={result['wall_time']:.2f}s")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the savings heuristic on batches of instances")
+    parser.add_argument("patterns", nargs="+", help="instance folders or glob patterns")
+    parser.add_argument("--initial", nargs="+", default=STRATEGIES, help="initial assignment strategies")
+    parser.add_argument("--save", nargs="+", default=STRATEGIES, help="savings list strategies (also: regret)")
+    parser.add_argument("--close", nargs="+", default=STRATEGIES, help="facility closure strategies (also: regret)")
+    parser.add_argument("--output", default="out/results.csv", help="results file (.csv or .jsonl)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--no-resume", action="store_true", help="run jobs that already have results")
+    parser.add_argument("--stats-dir", default=None, help="folder for the timers and counters of each job (JSON)")
+    parser.add_argument("--solutions-dir", default=None, help="folder for the solution of each job (JSON)")
+    args = parser.parse_args(argv)
+    run_batch(
+        args.patterns,
+        initial=args.initial,
+        save=args.save,
+        close=args.close,
+        output=args.output,
+        workers=args.workers,
+        resume=not args.no_resume,
+        stats_dir=args.stats_dir,
+        solutions_dir=args.solutions_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Local solver service
+Long-running asyncio HTTP server (TCP or Unix socket) around savings_heur, so the imports,
+the instance parse and the marginal/rank matrices are paid once instead of once per solve:
+    - parsed instances are kept in an LRU cache limited by count and size, placed in shared memory
+      (see parallel.SharedInstance) so the worker processes attach to them instead of parsing again
+      (workers detach the instances evicted by the service at their next solve)
+    - solves run on a pool of worker processes, with a time_limit (default and maximum set by the service);
+      running solves are stopped, not waited for, when the service shuts down
+
+endpoints:
+    - POST /solve: {"path": instance file} or {"instance": {"capacity", "cost_open", "demand", "costs"}}
+      plus optional "k_nearest", "out_of_core", "assignment" (return the assignment, default true)
+      and "params" (savings_heur parameters, see SOLVE_PARAMS)
+    - GET /health: status and uptime
+    - GET /metrics: requests, solves and cache counters
+
+usage:
+    python src/service.py --port 8765 --workers 4
+    python src/service.py --unix /tmp/cflp.sock
+    curl -s localhost:8765/solve -d '{"path": "inputs/Holmberg_Instances/p13", "params": {"initial": "greedy_marginal"}}'
+"""
+
+from importer import Importer
+from heuristic import savings_heur
+from parallel import SharedInstance, attach_instance
+from instrument import logger, enable_logging
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import numpy as np
+
+# parsed instances kept by the service (and attached by each worker)
+CACHE_SIZE = 8
+CACHE_BYTES = 2 << 30
+# largest request body accepted
+MAX_BODY_BYTES = 256 << 20
+# time_limit of the solves (seconds): used when the request has none, and largest accepted
+DEFAULT_TIME_LIMIT = 60.0
+MAX_TIME_LIMIT = 600.0
+# savings_heur parameters accepted by /solve
+SOLVE_PARAMS = (
+    "initial", "save", "close", "incremental", "local_search", "selection", "beta", "seed",
+    "time_limit", "max_iteration", "bound", "gap_target")
+INLINE_ARRAYS = ("capacity", "cost_open", "demand", "costs")
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+# instances attached by the current worker process (see solve_job)
+worker_state = {"instances": collections.OrderedDict(), "cache_size": CACHE_SIZE, "cache_bytes": CACHE_BYTES}
+
+
+class ServiceError(Exception):
+    """
+    Request error answered with the given HTTP status
+    """
+    def __init__(self, status:int, message:str):
+        super().__init__(message)
+        self.status = status
+
+
+def init_worker(cache_size, cache_bytes=CACHE_BYTES):
+    """
+    Worker initializer: only warnings of the solves are logged
+    """
+    worker_state["cache_size"] = cache_size
+    worker_state["cache_bytes"] = cache_bytes
+    logger.setLevel(logging.WARNING)
+
+
+def detach_instance(instances, key):
+    """
+    close the shared memory blocks a worker attached for the key
+    """
+    _, blocks, _ = instances.pop(key)
+    for block in blocks:
+        block.close()
+
+
+def solve_job(key, spec, params, with_assignment=True, live_keys=None) -> dict:
+    """
+    Worker task: run savings_heur on a shared instance, attached once per worker process
+    the attached instances are limited by count and size like the service cache, and those
+    evicted by the service (not in live_keys) are detached, so their memory can be freed
+    """
+    instances = worker_state["instances"]
+    if live_keys is not None:
+        for old_key in [old_key for old_key in instances if old_key != key and old_key not in live_keys]:
+            detach_instance(instances, old_key)
+    if key in instances:
+        instances.move_to_end(key)
+        data = instances[key][0]
+    else:
+        data, blocks = attach_instance(spec)
+        instances[key] = (data, blocks, instance_nbytes(data))
+        while len(instances) > 1 and (len(instances) > worker_state["cache_size"]
+                                      or sum(entry[2] for entry in instances.values()) > worker_state["cache_bytes"]):
+            detach_instance(instances, next(iter(instances)))
+    start_time = time.perf_counter()
+    net = savings_heur(data=data, **params)
+    result = {
+        "instance_type": data.instance_type,
+        "instance": data.instance,
+        "cost": net.total_cost,
+        "feasible": net.check(),
+        "iterations": net.iterations,
+        "stop_reason": net.stop_reason,
+        "lower_bound": net.lower_bound,
+        "gap": net.calc_gap(),
+        "solve_time": time.perf_counter() - start_time,
+    }
+    if with_assignment:
+        result["assignment"] = net.assignment.tolist()
+    return result
+
+
+def instance_nbytes(data:Importer) -> int:
+    """
+    memory used by the in-memory arrays of an instance (memory-mapped arrays are not counted)
+    """
+    return sum(
+        array.nbytes for array in (getattr(data, name, None) for name in
+                                   ("capacity", "cost_open", "demand", "costs", "marginal", "rank_matrix",
+                                    "knn_indptr", "knn_indices", "knn_costs"))
+        if array is not None and not isinstance(array, np.memmap))
+
+
+def load_shared(load):
+    """
+    load an instance with load() and place it in shared memory: returns the SharedInstance and its size
+    """
+    data = load()
+    return SharedInstance(data), instance_nbytes(data)
+
+
+class InstanceCache:
+    """
+    Class for keeping parsed instances in shared memory, least recently used first out
+    limited by number of instances and by their size in memory;
+    instances used by running solves are never evicted
+    """
+    def __init__(self, max_items:int=CACHE_SIZE, max_bytes:int=CACHE_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        # key -> [SharedInstance, size, solves using it]
+        self.entries = collections.OrderedDict()
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry[1] for entry in self.entries.values())
+
+    async def acquire(self, key:str, load):
+        """
+        shared instance spec of the key, loaded with load() (in a thread) if not cached
+        returns the spec and whether it was cached, release(key) must be called after use
+        """
+        if key in self.entries:
+            self.hits += 1
+        elif key in self.loading:
+            # same instance requested while it is being parsed
+            self.hits += 1
+            await asyncio.shield(self.loading[key])
+        else:
+            self.misses += 1
+            future = asyncio.get_running_loop().create_future()
+            self.loading[key] = future
+            try:
+                shared, nbytes = await asyncio.get_running_loop().run_in_executor(None, load_shared, load)
+                self.entries[key] = [shared, nbytes, 0]
+                future.set_result(None)
+            except Exception as error:
+                future.set_exception(error)
+                # the waiting requests get the error, nobody else retrieves it
+                future.exception()
+                raise
+            finally:
+                del self.loading[key]
+            entry = self.entries[key]
+            entry[2] += 1
+            self.evict()
+            return entry[0].spec, False
+        if key not in self.entries:
+            raise ServiceError(500, f"instance {key} could not be loaded")
+        entry = self.entries[key]
+        self.entries.move_to_end(key)
+        entry[2] += 1
+        return entry[0].spec, True
+
+    def release(self, key:str):
+        if key in self.entries:
+            self.entries[key][2] -= 1
+            self.evict()
+
+    def evict(self):
+        """
+        drop the least recently used instances not in use while the limits are exceeded
+        """
+        for key in list(self.entries):
+            if len(self.entries) <= self.max_items and self.nbytes <= self.max_bytes:
+                break
+            shared, _, users = self.entries[key]
+            if users:
+                continue
+            del self.entries[key]
+            shared.close()
+            self.evictions += 1
+            logger.info("> instance evicted from cache: %s", key)
+
+    def close(self):
+        for shared, _, _ in self.entries.values():
+            shared.close()
+        self.entries.clear()
+
+
+class SolverService:
+    """
+    Class for serving solve requests over HTTP (see module docstring)
+    """
+    def __init__(self, workers=None, cache_size:int=CACHE_SIZE, cache_bytes:int=CACHE_BYTES,
+                 time_limit:float=DEFAULT_TIME_LIMIT, max_time_limit:float=MAX_TIME_LIMIT):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = InstanceCache(cache_size, cache_bytes)
+        self.time_limit = min(time_limit, max_time_limit)
+        self.max_time_limit = max_time_limit
+        # spawned workers: forked ones would inherit the mappings of the instances cached so far
+        self.pool = multiprocessing.get_context("spawn").Pool(
+            self.workers, initializer=init_worker, initargs=(cache_size, cache_bytes))
+        # solves submitted to the pool and not finished yet (asyncio futures)
+        self.jobs = set()
+        self.start_time = time.time()
+        self.requests = collections.Counter()
+        self.solves = 0
+        self.errors = 0
+        self.running = 0
+        self.solve_time = 0.0
+
+    def close(self):
+        """
+        stop the workers without waiting for the running solves, which are answered with 503
+        """
+        try:
+            self.pool.terminate()
+            self.pool.join()
+        finally:
+            for job in self.jobs:
+                if not job.done():
+                    job.set_exception(ServiceError(503, "solve stopped: the service is shutting down"))
+            self.jobs.clear()
+            self.cache.close()
+
+    def submit(self, *args) -> asyncio.Future:
+        """
+        run solve_job(*args) on the pool, the result is set on the returned future
+        """
+        loop = asyncio.get_running_loop()
+        job = loop.create_future()
+
+        def settle(method, value):
+            if not job.done():
+                method(value)
+
+        self.jobs.add(job)
+        job.add_done_callback(self.jobs.discard)
+        # the callbacks run in a thread of the pool
+        self.pool.apply_async(
+            solve_job, args,
+            callback=lambda result: loop.call_soon_threadsafe(settle, job.set_result, result),
+            error_callback=lambda error: loop.call_soon_threadsafe(settle, job.set_exception, error))
+        return job
+
+    async def handle_connection(self, reader, writer):
+        """
+        answer one HTTP request (JSON in, JSON out) and close the connection
+        """
+        try:
+            try:
+                method, path, body = await read_request(reader)
+                status, payload = await self.dispatch(method, path, body)
+            except ServiceError as error:
+                status, payload = error.status, {"status": "error", "error": str(error)}
+            except (ValueError, asyncio.IncompleteReadError) as error:
+                status, payload = 400, {"status": "error", "error": f"invalid request: {error}"}
+            content = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(content)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + content)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method:str, path:str, body:bytes):
+        self.requests[path] += 1
+        routes = {"/solve": ("POST", self.solve), "/health": ("GET", self.health), "/metrics": ("GET", self.metrics)}
+        if path not in routes:
+            raise ServiceError(404, f"unknown endpoint: {path}")
+        route_method, handler = routes[path]
+        if method != route_method:
+            raise ServiceError(405, f"{path} expects {route_method}")
+        return 200, await handler(body)
+
+    async def health(self, body:bytes) -> dict:
+        return {"status": "ok", "uptime": time.time() - self.start_time, "workers": self.workers}
+
+    async def metrics(self, body:bytes) -> dict:
+        return {
+            "uptime": time.time() - self.start_time,
+            "workers": self.workers,
+            "requests": dict(self.requests),
+            "solves": self.solves,
+            "errors": self.errors,
+            "running": self.running,
+            "solve_time": self.solve_time,
+            "cache": {
+                "instances": len(self.cache.entries),
+                "bytes": self.cache.nbytes,
+                "max_instances": self.cache.max_items,
+                "max_bytes": self.cache.max_bytes,
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+                "evictions": self.cache.evictions,
+            },
+        }
+
+    async def solve(self, body:bytes) -> dict:
+        loop = asyncio.get_running_loop()
+        try:
+            # large bodies are parsed out of the event loop
+            request = await loop.run_in_executor(None, json.loads, body or b"{}")
+        except ValueError as error:
+            raise ServiceError(400, f"invalid JSON: {error}")
+        if not isinstance(request, dict):
+            raise ServiceError(400, "the request must be a JSON object")
+        params = request.get("params", {})
+        if not isinstance(params, dict):
+            raise ServiceError(400, "params must be a JSON object")
+        params = dict(params)
+        unknown = set(params) - set(SOLVE_PARAMS)
+        if unknown:
+            raise ServiceError(400, f"unknown parameters: {sorted(unknown)}")
+        params["time_limit"] = self.solve_time_limit(params.get("time_limit"))
+        key, load = await loop.run_in_executor(None, instance_loader, request)
+        start_time = time.perf_counter()
+        self.running += 1
+        try:
+            spec, cached = await self.cache.acquire(key, load)
+            try:
+                result = await self.submit(
+                    key, spec, params, bool(request.get("assignment", True)), frozenset(self.cache.entries))
+            finally:
+                self.cache.release(key)
+        except ServiceError:
+            self.errors += 1
+            raise
+        except Exception as error:
+            self.errors += 1
+            logger.warning("> solve failed: %s", error)
+            raise ServiceError(500, f"{type(error).__name__}: {error}")
+        finally:
+            self.running -= 1
+        self.solves += 1
+        self.solve_time += result["solve_time"]
+        return {"status": "ok", "cached": cached, "time_limit": params["time_limit"],
+                "wall_time": time.perf_counter() - start_time, **result}
+
+    def solve_time_limit(self, time_limit) -> float:
+        """
+        time_limit of a solve: the service default if the request has none, at most max_time_limit
+        """
+        if time_limit is None:
+            return self.time_limit
+        if isinstance(time_limit, bool) or not isinstance(time_limit, (int, float)) or not time_limit >= 0:
+            raise ServiceError(400, f"invalid time_limit: {time_limit}")
+        return min(float(time_limit), self.max_time_limit)
+
+
+def instance_loader(request:dict):
+    """
+    cache key and loader (function returning an Importer) of the instance of a solve request
+    files are identified by path, modification time and size, inline instances by content
+    """
+    k_nearest = request.get("k_nearest")
+    out_of_core = bool(request.get("out_of_core", False))
+    if "path" in request:
+        path = os.path.realpath(request["path"])
+        if not os.path.isfile(path):
+            raise ServiceError(400, f"instance file not found: {request['path']}")
+        status = os.stat(path)
+        key = f"{path}:{status.st_mtime_ns}:{status.st_size}:{k_nearest}:{out_of_core}"
+        return key, lambda: Importer(path, k_nearest=k_nearest, out_of_core=out_of_core)
+    if "instance" in request:
+        instance = request["instance"]
+        if not isinstance(instance, dict) or set(INLINE_ARRAYS) - set(instance):
+            raise ServiceError(400, f"inline instances need {list(INLINE_ARRAYS)}")
+        content_hash = hashlib.sha256(json.dumps([instance[name] for name in INLINE_ARRAYS]).encode()).hexdigest()
+        key = f"inline:{content_hash}:{k_nearest}"
+
+        def load():
+            arrays = {name: np.asarray(instance[name], dtype=float) for name in INLINE_ARRAYS}
+            if arrays["costs"].shape != (arrays["demand"].size, arrays["capacity"].size):
+                raise ServiceError(400, "costs must be a clients x facilities matrix")
+            data = Importer.from_arrays(arrays, instance_type="inline", instance=content_hash[:12])
+            if k_nearest:
+                data.calculate_candidates(k_nearest)
+            return data
+        return key, load
+    raise ServiceError(400, "the request needs a 'path' or an 'instance'")
+
+
+async def read_request(reader):
+    """
+    read an HTTP request: returns method, path (without query) and body
+    """
+    request_line = await reader.readline()
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise ServiceError(413, f"request body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], body
+
+
+async def serve(host="127.0.0.1", port:int=8765, unix=None, workers=None,
+                cache_size:int=CACHE_SIZE, cache_bytes:int=CACHE_BYTES,
+                time_limit:float=DEFAULT_TIME_LIMIT, max_time_limit:float=MAX_TIME_LIMIT):
+    """
+    run the service until cancelled (or SIGTERM)
+    """
+    service = SolverService(workers, cache_size, cache_bytes, time_limit, max_time_limit)
+    try:
+        if unix:
+            server = await asyncio.start_unix_server(service.handle_connection, path=unix)
+            address = unix
+        else:
+            server = await asyncio.start_server(service.handle_connection, host, port)
+            address = f"http://{host}:{port}"
+        logger.info("> solver service listening on %s (%d workers)", address, service.workers)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        logger.info("> solver service stopped")
+    finally:
+        service.close()
+        if unix and os.path.exists(unix):
+            os.remove(unix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve savings heuristic solves over HTTP with an instance cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="Unix socket path (instead of host and port)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="instances kept in memory")
+    parser.add_argument("--cache-mb", type=int, default=CACHE_BYTES >> 20, help="memory limit of the cached instances")
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT,
+                        help="seconds of the solves that do not set a time_limit")
+    parser.add_argument("--max-time-limit", type=float, default=MAX_TIME_LIMIT,
+                        help="largest time_limit accepted (larger ones are reduced)")
+    args = parser.parse_args(argv)
+    enable_logging()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.cache_size, args.cache_mb << 20,
+                          args.time_limit, args.max_time_limit))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
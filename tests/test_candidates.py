@@ -0,0 +1,60 @@
+"""
+Regression tests of the sparse candidate mode
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from importer import Importer
+from heuristic import LocalSearch, preferred_facilities, dummy_greedy_net
+from test_savings import random_instance
+import numpy as np
+import pytest
+
+
+def test_candidate_costs_follow_the_candidate_lists():
+    data = random_instance(20, 60, 1)
+    data.calculate_candidates(4)
+    for cli_idx in range(len(data.clients)):
+        candidates = data.get_candidates(cli_idx)
+        costs = data.get_candidate_costs(cli_idx)
+        assert costs.tolist() == data.costs[cli_idx, candidates].tolist()
+        assert costs.tolist() == sorted(data.costs[cli_idx])[:4]
+
+
+def uneven_candidates(data, seed=0):
+    """
+    candidate lists of 1 to 5 cheapest facilities per client (CSR arrays with uneven rows)
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, 6, len(data.clients))
+    order = np.argsort(data.costs, axis=1, kind="stable")
+    indices = np.concatenate([order[cli_idx, :count] for cli_idx, count in enumerate(counts)]).astype(np.int32)
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    arrays = {name: getattr(data, name) for name in ("capacity", "cost_open", "demand", "costs")}
+    return Importer.from_arrays({**arrays, "knn_indptr": indptr, "knn_indices": indices}), counts
+
+
+@pytest.mark.parametrize("how", ["greedy_cost", "greedy_marginal"])
+def test_preferred_facilities_with_uneven_candidate_lists(how):
+    data, counts = uneven_candidates(random_instance(20, 60, 2))
+    assert data.k_nearest == counts.max()
+    matrix = data.costs if how == "greedy_cost" else data.rank_matrix
+    expected = [int(candidates[np.argmin(matrix[cli_idx, candidates])])
+                for cli_idx, candidates in enumerate(map(data.get_candidates, range(len(data.clients))))]
+    assert preferred_facilities(data, how).tolist() == expected
+
+
+def test_local_search_with_uneven_candidate_lists():
+    data, counts = uneven_candidates(random_instance(20, 60, 3, 1.5))
+    search = LocalSearch(dummy_greedy_net(data), candidates=3)
+    for cli_idx, count in enumerate(counts):
+        start, end = search.cand_indptr[cli_idx], search.cand_indptr[cli_idx + 1]
+        assert search.cand_indices[start:end].tolist() == data.get_candidates(cli_idx)[:3].tolist()
+        assert search.cand_costs[start:end].tolist() == data.get_candidate_costs(cli_idx)[:3].tolist()
+    net = search.execute()
+    assert net.check()
+    assert net.total_cost == pytest.approx(net.calc_cost())
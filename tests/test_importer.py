@@ -0,0 +1,158 @@
+"""
+Regression tests of the instance import
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from importer import Importer
+import importer
+import gzip
+import numpy as np
+import pytest
+
+
+def instance_text(number_facilities, number_clients, seed=0, layout="Holmberg_Instances"):
+    """
+    text of a random instance file: costs by client rows (Holmberg) or by facility rows (OR-Library),
+    with uneven line breaks and decimal values, and the cost matrix (clients x facilities)
+    """
+    rng = np.random.default_rng(seed)
+    capacity = rng.integers(100, 900, number_facilities)
+    cost_open = rng.integers(300, 999, number_facilities)
+    demand = rng.integers(5, 40, number_clients)
+    costs = np.round(rng.uniform(1, 99, (number_clients, number_facilities)), 3)
+    lines = [f"{number_facilities} {number_clients}"]
+    lines += [f"{cap} {cost}" for cap, cost in zip(capacity, cost_open)]
+    values = [str(value) for value in demand]
+    values += [repr(float(value)) for value in (costs if layout == "Holmberg_Instances" else costs.T).ravel()]
+    widths = rng.integers(1, 9, len(values))
+    position = 0
+    for width in widths:
+        if position >= len(values):
+            break
+        lines.append(" ".join(values[position:position + width]))
+        position += width
+    # no line break at the end of the file: the last number ends the last chunk
+    return "\n".join(lines), costs
+
+
+def write_instance(tmp_path, text, name="t1", layout="Holmberg_Instances", gz=False):
+    folder = tmp_path / layout
+    folder.mkdir(exist_ok=True)
+    path = folder / (name + (".gz" if gz else ""))
+    if gz:
+        with gzip.open(path, "wb") as file:
+            file.write(text.encode())
+    else:
+        path.write_text(text)
+    return str(path)
+
+
+@pytest.mark.parametrize("gz", [False, True])
+def test_tokens_do_not_depend_on_the_chunk_size(tmp_path, monkeypatch, gz):
+    text, _ = instance_text(4, 9)
+    path = write_instance(tmp_path, text, gz=gz)
+    expected = np.array(text.split(), dtype=float)
+    data = Importer.__new__(Importer)
+    data.init_data(path, use_cache=False)
+    for chunk_size in range(1, 65):
+        monkeypatch.setattr(importer, "READ_CHUNK_SIZE", chunk_size)
+        assert data.read_tokens().tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("layout", ["Holmberg_Instances", "OR-Library_Instances"])
+def test_import_with_small_chunks(tmp_path, monkeypatch, layout):
+    text, costs = instance_text(5, 12, 1, layout)
+    path = write_instance(tmp_path, text, layout=layout)
+    monkeypatch.setattr(importer, "READ_CHUNK_SIZE", 7)
+    data = Importer(path, use_cache=False)
+    assert data.costs.tolist() == costs.tolist()
+    assert data.demand.size == 12 and data.capacity.size == 5
+
+
+def fail_import(self):
+    raise AssertionError("the instance file was parsed again")
+
+
+def test_cache_is_reused(tmp_path, monkeypatch):
+    text, costs = instance_text(4, 9, 2)
+    path = write_instance(tmp_path, text)
+    parsed = Importer(path)
+    assert os.path.isfile(parsed.cache_path())
+    monkeypatch.setattr(Importer, "import_file", fail_import)
+    cached = Importer(path)
+    assert cached.costs.tolist() == costs.tolist()
+    for name in ("capacity", "cost_open", "demand", "marginal", "rank_matrix"):
+        assert getattr(cached, name).tolist() == getattr(parsed, name).tolist()
+
+
+def test_cache_is_invalidated_by_an_edited_file(tmp_path):
+    text, _ = instance_text(4, 9, 3)
+    path = write_instance(tmp_path, text)
+    Importer(path)
+    edited_text, edited_costs = instance_text(4, 9, 4)
+    write_instance(tmp_path, edited_text)
+    edited = Importer(path)
+    assert edited.costs.tolist() == edited_costs.tolist()
+    assert edited.marginal.tolist() == Importer(path, use_cache=False).marginal.tolist()
+
+
+def test_invalid_cache_is_replaced(tmp_path):
+    text, costs = instance_text(4, 9, 5)
+    path = write_instance(tmp_path, text)
+    cache_path = Importer(path).cache_path()
+    with open(cache_path, "wb") as file:
+        file.write(b"not a cache")
+    assert Importer(path).costs.tolist() == costs.tolist()
+    with np.load(cache_path) as cache:
+        assert cache["costs"].tolist() == costs.tolist()
+
+
+@pytest.mark.parametrize("layout", ["Holmberg_Instances", "OR-Library_Instances"])
+@pytest.mark.parametrize("gz", [False, True])
+def test_out_of_core_import_matches_dense_import(tmp_path, monkeypatch, layout, gz):
+    text, costs = instance_text(7, 23, 6, layout)
+    path = write_instance(tmp_path, text, layout=layout, gz=gz)
+    # several chunks and blocks of clients and facilities
+    monkeypatch.setattr(importer, "READ_CHUNK_SIZE", 64)
+    monkeypatch.setattr(importer, "BLOCK_SIZE", 20)
+    data = Importer(path, out_of_core=True)
+    dense = Importer(path, use_cache=False)
+    assert isinstance(data.costs, np.memmap)
+    assert data.costs.dtype == np.float32
+    assert np.asarray(data.costs).tolist() == costs.astype(np.float32).tolist()
+    marginal = Importer.marginal_rows(costs.astype(np.float32))
+    assert np.asarray(data.marginal).tolist() == marginal.tolist()
+    assert np.asarray(data.rank_matrix).tolist() == Importer.rank_columns(marginal).tolist()
+    for name in ("capacity", "cost_open", "demand"):
+        assert getattr(data, name).tolist() == getattr(dense, name).tolist()
+
+
+def test_out_of_core_files_are_reused(tmp_path, monkeypatch):
+    text, costs = instance_text(4, 9, 7)
+    path = write_instance(tmp_path, text)
+    Importer(path, out_of_core=True)
+    monkeypatch.setattr(Importer, "import_file_out_of_core", fail_import)
+    assert np.asarray(Importer(path, out_of_core=True).costs).tolist() == costs.astype(np.float32).tolist()
+
+
+def test_out_of_core_files_are_invalidated(tmp_path):
+    text, _ = instance_text(4, 9, 8)
+    path = write_instance(tmp_path, text)
+    paths = Importer(path, out_of_core=True).mmap_paths()
+    # edited instance file
+    edited_text, edited_costs = instance_text(4, 9, 9)
+    write_instance(tmp_path, edited_text)
+    expected = edited_costs.astype(np.float32).tolist()
+    assert np.asarray(Importer(path, out_of_core=True).costs).tolist() == expected
+    # cost file of another shape
+    np.save(paths["costs"], np.zeros((3, 3), dtype=np.float32))
+    assert np.asarray(Importer(path, out_of_core=True).costs).tolist() == expected
+    # missing meta file
+    os.remove(paths["meta"])
+    assert np.asarray(Importer(path, out_of_core=True).costs).tolist() == expected
+    assert os.path.isfile(paths["meta"])
@@ -0,0 +1,33 @@
+"""
+Regression tests of the local search
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from importer import Importer
+from network import Net
+from heuristic import LocalSearch
+import numpy as np
+
+
+def test_shift_skips_the_current_facility():
+    # facility 0 only serves client 0 and could take it twice: "moving" it there is not a saving
+    arrays = {
+        "capacity": np.array([20.0, 20.0]),
+        "cost_open": np.array([10.0, 10.0]),
+        "demand": np.array([5.0, 5.0, 5.0]),
+        "costs": np.array([[1.0, 100.0], [100.0, 1.0], [100.0, 1.0]]),
+    }
+    data = Importer.from_arrays(arrays, instance_type="test", instance="shift")
+    net = Net("shift", data)
+    net.set_assignment([0, 1, 1])
+    cost = net.calc_cost()
+    search = LocalSearch(net)
+    search.execute()
+    assert search.shifts == 0
+    assert net.assignment.tolist() == [0, 1, 1]
+    assert net.calc_cost() == cost
@@ -0,0 +1,23 @@
+"""
+Regression tests of the multi-start driver
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from multistart import multistart
+from test_savings import random_instance
+import pytest
+
+
+@pytest.mark.parametrize("initial", ["greedy_cost", "add", "drop"])
+def test_multistart_bound_with_every_initial_construction(initial):
+    data = random_instance(12, 60, 4)
+    net, results = multistart(data=data, runs=2, workers=1, initial=initial, local_search=False, bound=True)
+    assert net.check()
+    assert len(results) == 3
+    assert 0 < net.lower_bound <= net.total_cost
+    assert all(result["gap"] is not None for result in results)
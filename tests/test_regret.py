@@ -0,0 +1,71 @@
+"""
+Regression tests of the regret relocation
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from network import Action
+from heuristic import dummy_greedy_net
+from test_savings import random_instance
+import pytest
+
+
+def reference_regret(net, facility):
+    """
+    relocation of the clients of the facility recalculating every regret at each step
+    (None if a client cannot be relocated)
+    in sparse mode a client only considers its candidates, unless none of them fits
+    """
+    data = net.data
+    clients = [client.index for client in net.get_assigned_cli_to_fac(facility)]
+    residual = data.capacity - net.load
+    for cli_idx in clients:
+        residual[facility.index] += data.demand[cli_idx]
+    candidates = [fac_idx for fac_idx in range(len(data.facilities)) if net.is_open[fac_idx] and fac_idx != facility.index]
+    assignment = {}
+    remaining = list(clients)
+    while remaining:
+        best = None
+        for rank, cli_idx in enumerate(clients):
+            if cli_idx not in remaining:
+                continue
+            feasible = []
+            if data.knn_indices is not None:
+                feasible = [fac_idx for fac_idx in data.get_candidates(cli_idx).tolist()
+                            if fac_idx in candidates and residual[fac_idx] >= data.demand[cli_idx]][:2]
+            if not feasible:
+                feasible = [fac_idx for fac_idx in sorted(candidates, key=lambda fac_idx: data.costs[cli_idx, fac_idx])
+                            if residual[fac_idx] >= data.demand[cli_idx]][:2]
+            if not feasible:
+                return None
+            value = float("inf") if len(feasible) == 1 else float(data.costs[cli_idx, feasible[1]] - data.costs[cli_idx, feasible[0]])
+            if best is None or (-value, rank) < best[0]:
+                best = ((-value, rank), cli_idx, feasible[0])
+        _, cli_idx, fac_idx = best
+        assignment[cli_idx] = fac_idx
+        residual[fac_idx] -= data.demand[cli_idx]
+        remaining.remove(cli_idx)
+    return assignment
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("ratio", [1.1, 1.3, 2.0])
+@pytest.mark.parametrize("k_nearest", [None, 3])
+def test_regret_relocation_is_largest_regret_first(seed, ratio, k_nearest):
+    data = random_instance(12, 90, seed, ratio)
+    if k_nearest:
+        data.calculate_candidates(k_nearest)
+    net = dummy_greedy_net(data)
+    for facility in data.facilities:
+        if not net.is_open[facility.index]:
+            continue
+        expected = reference_regret(net, facility)
+        action = Action(net).close_facility(facility, how="regret")
+        assert action.feasible == (expected is not None)
+        if expected is not None:
+            assert {cli_idx: int(net.assignment[cli_idx]) for cli_idx in expected} == expected
+        action.undo()
@@ -0,0 +1,82 @@
+"""
+Regression tests of the savings heuristic
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from importer import Importer
+from heuristic import savings_heur
+import heuristic
+import numpy as np
+import pytest
+
+
+def random_instance(number_facilities, number_clients, seed=0, ratio=2.0):
+    """
+    random euclidean instance whose total capacity is ratio times the total demand
+    """
+    rng = np.random.default_rng(seed)
+    demand = rng.integers(5, 50, number_clients).astype(float)
+    capacity = rng.uniform(0.5, 1.5, number_facilities)
+    capacity = np.round(capacity / capacity.sum() * demand.sum() * ratio)
+    fac_xy = rng.uniform(0, 100, (number_facilities, 2))
+    cli_xy = rng.uniform(0, 100, (number_clients, 2))
+    costs = np.round(np.linalg.norm(cli_xy[:, np.newaxis] - fac_xy[np.newaxis], axis=2))
+    cost_open = np.round(rng.uniform(100, 400, number_facilities))
+    arrays = {"capacity": capacity, "cost_open": cost_open, "demand": demand, "costs": costs}
+    return Importer.from_arrays(arrays, instance_type="random", instance=f"{number_facilities}x{number_clients}_{seed}")
+
+
+@pytest.mark.parametrize("how", ["greedy_cost", "greedy_marginal", "regret"])
+@pytest.mark.parametrize("ratio", [1.3, 2.0, 3.0])
+def test_incremental_savings_match_full_savings(how, ratio):
+    # (15, 80, 6, 3.0): demand received by a facility over several closures exceeds a kept headroom
+    for number_facilities, number_clients, seed in [(15, 80, 6), (25, 150, 14), (25, 150, 18), (10, 40, 27)]:
+        data = random_instance(number_facilities, number_clients, seed, ratio)
+        incremental = savings_heur(data=data, save=how, close=how, incremental=True, local_search=False)
+        full = savings_heur(data=data, save=how, close=how, incremental=False, local_search=False)
+        assert incremental.assignment.tolist() == full.assignment.tolist()
+        assert incremental.iterations == full.iterations
+        assert incremental.total_cost == pytest.approx(full.total_cost)
+        assert incremental.stop_reason != "max_iteration"
+
+
+def test_stale_savings_entries_are_simulated_again(monkeypatch):
+    # entries never invalidated: closures whose stored balance is stale must not be executed or counted
+    monkeypatch.setattr(heuristic.SavingsList, "update", lambda self, action: None)
+    data = random_instance(10, 40, 27, 1.3)
+    costs = []
+    net = savings_heur(data=data, incremental=True, local_search=False,
+                       callback=lambda iteration, cost, elapsed: costs.append(cost))
+    assert net.check()
+    assert net.stop_reason != "max_iteration"
+    assert net.iterations == len(costs) == len(data.facilities) - int(net.is_open.sum())
+    assert all(after < before for before, after in zip(costs, costs[1:]))
+
+
+def test_budget_before_first_closure_reports_the_initial_cost():
+    data = random_instance(10, 40, 27, 1.3)
+    net = savings_heur(data=data, time_limit=0.0)
+    assert net.stop_reason == "time_limit"
+    assert net.iterations == 0
+    assert net.total_cost > 0
+    assert net.total_cost == pytest.approx(net.calc_cost())
+
+
+@pytest.mark.parametrize("save, close", [("greedy_marginal", "greedy_cost"), ("greedy_cost", "regret"),
+                                         ("regret", "greedy_marginal")])
+@pytest.mark.parametrize("incremental", [True, False])
+def test_mixed_save_and_close_strategies_terminate(save, close, incremental):
+    # savings simulated with another strategy than the closures never match their balance
+    # (2, 1.2) and (3, 1.1): a closure feasible for save is not for close
+    for seed, ratio in [(6, 1.3), (14, 2.0), (27, 1.3), (2, 1.2), (3, 1.1)]:
+        data = random_instance(15, 80, seed, ratio)
+        net = savings_heur(data=data, save=save, close=close, incremental=incremental, local_search=False,
+                           time_limit=30.0)
+        assert net.stop_reason in ("empty", "no_saving")
+        assert net.check()
+        assert net.iterations == len(data.facilities) - int(net.is_open.sum())
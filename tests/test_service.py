@@ -0,0 +1,100 @@
+"""
+Regression tests of the solver service (HTTP over a local TCP port)
+run from the repository root: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from service import SolverService
+from test_importer import instance_text, write_instance
+from test_savings import random_instance
+import asyncio
+import json
+import time
+
+
+async def request(port, method, path, payload=None):
+    """
+    send one HTTP request, returns the status and the JSON answer
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    answer = await reader.read()
+    writer.close()
+    head, _, content = answer.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(content)
+
+
+def run_service(scenario, **options):
+    """
+    run scenario(service, port) against a service with one worker
+    """
+    async def main():
+        service = SolverService(workers=1, **options)
+        try:
+            server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+            async with server:
+                return await scenario(service, server.sockets[0].getsockname()[1])
+        finally:
+            service.close()
+    return asyncio.run(main())
+
+
+def test_health_and_solves(tmp_path):
+    path = write_instance(tmp_path, instance_text(6, 30, 1)[0])
+    inline_text, costs = instance_text(5, 20, 2)
+    values = [float(value) for value in inline_text.split()]
+    inline = {
+        "capacity": values[2:12:2],
+        "cost_open": values[3:12:2],
+        "demand": values[12:32],
+        "costs": costs.tolist(),
+    }
+
+    async def scenario(service, port):
+        status, health = await request(port, "GET", "/health")
+        assert status == 200 and health["status"] == "ok"
+        first = await request(port, "POST", "/solve", {"path": path, "params": {"local_search": False}})
+        second = await request(port, "POST", "/solve", {"path": path, "params": {"local_search": False}})
+        inline_answer = await request(port, "POST", "/solve", {"instance": inline, "params": {"time_limit": 1e6}})
+        unknown = await request(port, "POST", "/solve", {"path": path, "params": {"workers": 4}})
+        _, metrics = await request(port, "GET", "/metrics")
+        return first, second, inline_answer, unknown, metrics
+
+    first, second, inline_answer, unknown, metrics = run_service(scenario, time_limit=30.0, max_time_limit=60.0)
+    for status, answer in (first, second, inline_answer):
+        assert status == 200
+        assert answer["feasible"]
+    assert len(first[1]["assignment"]) == 30
+    assert first[1]["cached"] is False and second[1]["cached"] is True
+    assert first[1]["cost"] == second[1]["cost"]
+    assert first[1]["time_limit"] == 30.0
+    assert inline_answer[1]["time_limit"] == 60.0
+    assert len(inline_answer[1]["assignment"]) == 20
+    assert unknown[0] == 400
+    assert metrics["solves"] == 3
+    assert metrics["cache"]["hits"] == 1 and metrics["cache"]["misses"] == 2
+
+
+def test_close_stops_running_solves():
+    data = random_instance(150, 1500, 0, 1.5)
+    instance = {name: getattr(data, name).tolist() for name in ("capacity", "cost_open", "demand", "costs")}
+
+    async def scenario(service, port):
+        # about 10 seconds of solve without the incremental savings list
+        solve = asyncio.ensure_future(request(port, "POST", "/solve", {"instance": instance, "params": {"incremental": False}}))
+        while not service.running or not service.jobs:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(1.0)
+        start_time = time.perf_counter()
+        service.close()
+        return await solve, time.perf_counter() - start_time
+
+    (status, answer), elapsed = run_service(scenario)
+    assert status == 503
+    assert elapsed < 5.0